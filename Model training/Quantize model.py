@@ -0,0 +1,139 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from contextlib import suppress
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+# Helper modules live in the Program folder
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Project path is one level up
+sys.path.append(os.path.join(PROJECT_PATH, 'Program'))
+from image_loading import load_image
+from netlist_generator import TextFileSink, generate_netlist
+from model_registry import latest_train_weights
+from netlist_comparator import load_comparator
+from atomic_files import temporary_name
+from model_engines import QUANTIZED_ENGINE, export_model, exported_model_path, load_model
+
+CALIBRATION_IMAGES_FOLDER = os.path.join(PROJECT_PATH, 'Model training/data/images/val')
+NETLIST_TEST_FOLDER = os.path.join(PROJECT_PATH, 'Program test/Netlist generator algorithm test')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def letterbox(image, size=640):
+    """
+    Resizes and pads the image to size x size the way ultralytics prepares the input of an
+    exported model, so the calibration sees the same tensors as inference.
+    """
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+    left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+    # BGR HWC uint8 -> RGB NCHW float in [0, 1]
+    return np.ascontiguousarray(image[:, :, ::-1].transpose(2, 0, 1))[None].astype(np.float32) / 255
+
+class CalibrationImages(CalibrationDataReader):
+    # Feeds the calibration images to the ONNX Runtime quantizer one at a time
+    def __init__(self, images_folder, input_name, imgsz=640):
+        self.image_paths = iter([os.path.join(images_folder, image_file) for image_file in sorted(os.listdir(images_folder))
+                                 if image_file.lower().endswith(IMAGE_EXTENSIONS)])
+        self.input_name = input_name
+        self.imgsz = imgsz
+
+    def get_next(self):
+        image_path = next(self.image_paths, None)
+        if image_path is None:
+            return None
+        return {self.input_name: letterbox(load_image(image_path), self.imgsz)}
+
+def quantize_model(model_path, int8_path, calibration_folder=CALIBRATION_IMAGES_FOLDER, imgsz=640):
+    """
+    Statically quantizes the ONNX export of the model to INT8 (QDQ, per channel weights), with
+    the activation ranges calibrated on the images of calibration_folder, and saves it to int8_path.
+    Returns int8_path.
+    """
+    fp32_path = export_model(model_path, "onnx", imgsz)
+
+    fp32_model = onnx.load(fp32_path)
+    calibration_images = CalibrationImages(calibration_folder, fp32_model.graph.input[0].name, imgsz)
+    quantize_static(fp32_path, int8_path, calibration_images, quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+
+    # ultralytics reads the class names, stride and keypoint shape from the model metadata
+    int8_model = onnx.load(int8_path)
+    if not int8_model.metadata_props:
+        int8_model.metadata_props.extend(fp32_model.metadata_props)
+        onnx.save(int8_model, int8_path)
+
+    return int8_path
+
+def netlist_accuracy(model, results_folder):
+    """
+    Generates the netlists of the netlist test images with the model and scores them with the
+    node match accuracy of Methods Results Comparator.py:
+    matched nodes / (actual nodes + false generated nodes), in percent.
+    """
+    images_folder = os.path.join(NETLIST_TEST_FOLDER, 'Test images')
+    sink = TextFileSink(results_folder)
+    for image_file in sorted(os.listdir(images_folder)):
+        if image_file.lower().endswith(IMAGE_EXTENSIONS):
+            sink.write(image_file, generate_netlist(os.path.join(images_folder, image_file), model))
+
+    correct_results_folder = os.path.join(NETLIST_TEST_FOLDER, 'Correct netlist results')
+    matched_nodes, correct_nodes, generated_nodes, _ = load_comparator().process_folder(results_folder,
+                                                                                        correct_results_folder,
+                                                                                        verbose=False)
+    false_nodes = generated_nodes - matched_nodes
+    return (matched_nodes / (correct_nodes + false_nodes)) * 100 if correct_nodes > 0 else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the pose model to INT8 and keep it only if the "
+                                                 "netlist accuracy stays within the tolerance.")
+    parser.add_argument("--tolerance", type=float, default=1.0,
+                        help="largest accepted drop in node match accuracy, in percentage points")
+    parser.add_argument("--imgsz", type=int, default=640, help="model input size, as used for training")
+    args = parser.parse_args()
+
+    latest_train_path = latest_train_weights()
+    int8_path = exported_model_path(latest_train_path, QUANTIZED_ENGINE)
+    # The candidate is quantized and evaluated next to the deployed INT8 model, which is only
+    # replaced once the candidate passes. ultralytics picks the backend from the .onnx suffix.
+    candidate_path = temporary_name(int8_path) + ".onnx"
+
+    results_folder = tempfile.mkdtemp()
+    try:
+        # Step 1: Accuracy of the FP32 ONNX model, the reference for the quantized one
+        fp32_accuracy = netlist_accuracy(load_model(latest_train_path, "onnx"), os.path.join(results_folder, 'fp32'))
+        print(f"FP32 accuracy: {fp32_accuracy:.2f}%")
+
+        # Step 2: Calibrate and quantize
+        quantize_model(latest_train_path, candidate_path, imgsz=args.imgsz)
+
+        # Step 3: Keep the INT8 model only if connectivity results don't regress
+        from ultralytics import YOLO
+        int8_accuracy = netlist_accuracy(YOLO(candidate_path, task="pose"), os.path.join(results_folder, 'int8'))
+        print(f"INT8 accuracy: {int8_accuracy:.2f}%")
+
+        if int8_accuracy >= fp32_accuracy - args.tolerance:
+            os.replace(candidate_path, int8_path)
+            print(f"Quantized model accepted and saved to {int8_path} (use --engine {QUANTIZED_ENGINE}).")
+        else:
+            print(f"Quantized model rejected: accuracy dropped by {fp32_accuracy - int8_accuracy:.2f} points, "
+                  f"more than the {args.tolerance} point tolerance.")
+    finally:
+        shutil.rmtree(results_folder, ignore_errors=True)
+        with suppress(OSError):
+            os.remove(candidate_path)  # Only there if the candidate was rejected or the run failed
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+# Helper modules live in the Program folder
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Project path is two levels up
+sys.path.append(os.path.join(PROJECT_PATH, 'Program'))
+from image_loading import load_image, to_model_input
+from netlist_generator import extract_circuit_info, compute_netlist
+from model_registry import latest_train_weights
+from model_engines import ENGINES, load_model
+
+TEST_IMAGES_FOLDER = os.path.join(PROJECT_PATH, 'Program test/Netlist generator algorithm test/Test images')
+RESULTS_FILE = os.path.join(PROJECT_PATH, 'Program test/Engine benchmark/Engine benchmark results.json')
+
+def benchmark_engine(model_path, engine, images, repeats=5, warmup=2):
+    """
+    Times inference of every image with the given engine and generates its netlists.
+    Returns the latencies in milliseconds and the netlist text of each image.
+    """
+    model = load_model(model_path, engine)
+
+    # The first calls include lazy initialisation of the runtime
+    for _ in range(warmup):
+        model(to_model_input(images[0][1]), verbose=False)
+
+    latencies = []
+    netlists = {}
+    for image_file, image in images:
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            results = model(to_model_input(image), verbose=False)[0]
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+        netlists[image_file] = compute_netlist(image, extract_circuit_info(results)).to_text()
+
+    return latencies, netlists
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference latency and netlist agreement per engine.")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--repeats", type=int, default=5, help="timed inference runs per image")
+    args = parser.parse_args()
+
+    latest_train_path = latest_train_weights()
+
+    images = [(image_file, load_image(os.path.join(TEST_IMAGES_FOLDER, image_file)))
+              for image_file in sorted(os.listdir(TEST_IMAGES_FOLDER))
+              if image_file.lower().endswith(('.jpg', '.jpeg', '.png'))]
+
+    # Netlists of the PyTorch checkpoint are the reference for the other engines
+    engines = ["pytorch"] + [engine for engine in args.engines if engine != "pytorch"]
+    summary = {}
+    reference_netlists = None
+    for engine in engines:
+        print(f"Benchmarking {engine}...")
+        try:
+            latencies, netlists = benchmark_engine(latest_train_path, engine, images, args.repeats)
+        except FileNotFoundError as error:
+            print(f"Skipping {engine}: {error}")  # e.g. the model has not been quantized yet
+            continue
+        reference_netlists = reference_netlists or netlists
+
+        matching = [image_file for image_file in netlists if netlists[image_file] == reference_netlists[image_file]]
+        p50, p90 = np.percentile(latencies, [50, 90])
+        summary[engine] = {
+            "mean_ms": round(float(np.mean(latencies)), 2),
+            "p50_ms": round(float(p50), 2),
+            "p90_ms": round(float(p90), 2),
+            "netlist_agreement": len(matching) / len(netlists),
+            "differing_images": sorted(set(netlists) - set(matching)),
+        }
+
+    print(f"\n{'Engine':<10} {'Mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'Agreement':>10}")
+    for engine, result in summary.items():
+        print(f"{engine:<10} {result['mean_ms']:>9.2f} {result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} "
+              f"{result['netlist_agreement']:>10.0%}")
+        if result["differing_images"]:
+            print(f"  netlists differ for: {', '.join(result['differing_images'])}")
+
+    with open(RESULTS_FILE, 'w') as results_file:
+        json.dump(summary, results_file, indent=4)
+    print(f"\nResults saved to: {RESULTS_FILE}")
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,21 @@
 import os
+import sys
 import cv2
 from tkinter import Tk, filedialog
-from ultralytics import YOLO
 
 # Get the current working directory and define the project root
 current_dir = os.getcwd()
 PROJECT_PATH = os.path.dirname(os.path.dirname(current_dir))  # Project path is two levels up
 
+# Shared helpers live in the Program folder
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'Program'))
+from model_registry import latest_train_weights
+from model_engines import load_model
+
 # Function for processing all images
 def process_all_images():
     # Find the latest training folder dynamically
-    pose_folder = os.path.join(PROJECT_PATH, 'Current trained model/pose')
-    train_folders = [folder for folder in os.listdir(pose_folder) if folder.startswith('train')]
-
-    # Check if there are train folders
-    if not train_folders:
-        raise FileNotFoundError("No 'train' folders found in the pose directory.")
-
-    # Determine the latest train folder
-    def extract_suffix(folder_name):
-        if folder_name == "train":
-            return 0
-        else:
-            return int(folder_name[5:])
-
-    latest_train_folder = max(train_folders, key=extract_suffix)
-    latest_train_path = os.path.join(pose_folder, latest_train_folder, 'weights', 'last.pt')
+    latest_train_path = latest_train_weights()
 
     # Define the image folder path dynamically
     image_folder = os.path.join(PROJECT_PATH, 'Program test/Model test/Test images')
@@ -36,7 +26,7 @@ def process_all_images():
 
     # Load YOLO model
     print(f"Loading model from: {latest_train_path}")
-    model = YOLO(latest_train_path)
+    model = load_model(latest_train_path)
 
     # Get a list of all image files in the folder
     image_files = [f for f in os.listdir(image_folder) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
@@ -48,8 +38,8 @@ def process_all_images():
         # Load image
         img = cv2.imread(image_path)
 
-        # Run inference
-        results = model(image_path)[0]
+        # Run inference on the already decoded image
+        results = model(img)[0]
 
         # Process each result
         for result in results:
@@ -100,31 +90,16 @@ def process_single_image():
         return
 
     # Load YOLO model
-    pose_folder = os.path.join(PROJECT_PATH, 'Current trained model/pose')
-    train_folders = [folder for folder in os.listdir(pose_folder) if folder.startswith('train')]
-
-    # Check if there are train folders
-    if not train_folders:
-        raise FileNotFoundError("No 'train' folders found in the pose directory.")
-
-    # Determine the latest train folder
-    def extract_suffix(folder_name):
-        if folder_name == "train":
-            return 0
-        else:
-            return int(folder_name[5:])
-
-    latest_train_folder = max(train_folders, key=extract_suffix)
-    latest_train_path = os.path.join(pose_folder, latest_train_folder, 'weights', 'last.pt')
+    latest_train_path = latest_train_weights()
 
     print(f"Loading model from: {latest_train_path}")
-    model = YOLO(latest_train_path)
+    model = load_model(latest_train_path)
 
     # Load the selected image
     img = cv2.imread(selected_file)
 
-    # Run inference
-    results = model(selected_file)[0]
+    # Run inference on the already decoded image
+    results = model(img)[0]
 
     # Process each result
     for result in results:
@@ -359,21 +359,28 @@
 
 
 
-# code without debugging images
+# code without debugging images (see --debug-images and --debug-sample-rate to save them in the background)
 import os
+import sys
+import argparse
 import cv2
 import numpy as np
-import json
-from ultralytics import YOLO
-from scipy.ndimage import label as connected_label
+from scipy.ndimage import label as connected_label, find_objects
 import matplotlib.pyplot as plt
 from matplotlib import cm
-from scipy.spatial import distance
+
+# Shared helpers live in the Program folder (project path is four levels up from this file)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))), 'Program'))
+from nearest_edge import NearestEdgeIndex
+from image_loading import load_image, to_grayscale
+from model_registry import latest_train_weights
+from model_engines import load_model
+from debug_artifacts import DebugArtifactWriter, annotate_detections, render_regions
+from detection_archive import DetectionArchive, ARCHIVE_FORMATS
 
 # Define helper functions
-def detect_edges(image_path):
-    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
-    grayscale = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+def detect_edges(image):
+    grayscale = to_grayscale(image)
     edges = cv2.Canny(grayscale, 50, 150)
     kernel = np.ones((5, 5), np.uint8)
     connected_edges = cv2.dilate(edges, kernel, iterations=2)
@@ -389,19 +396,10 @@ def mask_components(connected_edges, components):
 
     return masked_edges
 
-def find_nearest_edge(masked_edges, px, py):
-    edge_points = np.argwhere(masked_edges > 0)  # Get all edge points
-    if edge_points.size == 0:
-        return None  # No edges in the mask
-    distances = distance.cdist([(py, px)], edge_points)  # Compute distances from the point to all edges
-    nearest_index = np.argmin(distances)  # Index of the nearest edge
-    
-    return edge_points[nearest_index]  # Coordinates of the nearest edge (y, x)
-
-def is_point_connected_or_nearest(masked_edges, px, py):
+def is_point_connected_or_nearest(nearest_edge_index, px, py):
 
     # Find the nearest edge
-    nearest_edge = find_nearest_edge(masked_edges, px, py)
+    nearest_edge = nearest_edge_index.nearest(px, py)
     if nearest_edge is not None:
         return True, (nearest_edge[1], nearest_edge[0])  # Return x, y of the nearest edge
 
@@ -490,12 +488,16 @@ def is_point_connected_or_nearest(masked_edges, px, py):
 #                 # Write to the results file
 #                 results.write(f"{numbered_label} {' '.join(map(str, connected_nodes))}\n")
 
-def overlay_and_find_nodes_with_connected_regions(masked_edges, components, test_results_path, image_file, output_files_path):
-    labeled_edges, num_regions = connected_label(masked_edges)
+def overlay_and_find_nodes_with_connected_regions(connected_edges, masked_edges, nearest_edge_index, components, test_results_path, image_file,
+                                                  output_files_path, debug_writer=None):
+    labeled_edges, _ = connected_label(masked_edges)
+    region_slices = find_objects(labeled_edges)  # Bounding box of every region, in label order
     region_to_node = {}
     current_node_id = 1
 
     ground_regions = set()
+    debugging = debug_writer is not None and debug_writer.wants(image_file)
+    connection_points = []  # Snapped keypoints, only kept for the debug images
 
     # Assign node IDs to regions and identify ground regions
     for component in components:
@@ -504,9 +506,11 @@ def overlay_and_find_nodes_with_connected_regions(masked_edges, components, test
             if py >= labeled_edges.shape[0] or px >= labeled_edges.shape[1]:
                 continue
             
-            is_connected, connection_point = is_point_connected_or_nearest(masked_edges, px, py)
+            is_connected, connection_point = is_point_connected_or_nearest(nearest_edge_index, px, py)
             if is_connected:
                 connected_px, connected_py = connection_point
+                if debugging:
+                    connection_points.append(connection_point)
                 region = labeled_edges[connected_py, connected_px]  # Use the connected or nearest edge point
                 if region > 0:
                     if region not in region_to_node:
@@ -522,13 +526,12 @@ def overlay_and_find_nodes_with_connected_regions(masked_edges, components, test
             if region in region_to_node:
                 region_to_node[region] = min_ground_node
 
-    # Rearrange node IDs based on top-left-most pixel
+    # Rearrange node IDs based on top-left-most pixel, the first pixel of the top row of the region's bounding box
     region_top_left = {}
-    for region in range(1, num_regions + 1):
-        pixels = np.argwhere(labeled_edges == region)  # Get all pixels in the region
-        if len(pixels) > 0:
-            top_left_pixel = pixels[np.lexsort((pixels[:, 1], pixels[:, 0]))][0]  # Sort by (y, then x) and pick the first
-            region_top_left[region] = top_left_pixel
+    for region in region_to_node:
+        rows, columns = region_slices[region - 1]
+        top_row = labeled_edges[rows.start, columns]
+        region_top_left[region] = (rows.start, columns.start + np.argmax(top_row == region))  # (y, x)
 
     # Sort regions by top-left-most pixel
     sorted_regions = sorted(region_top_left.items(), key=lambda x: (x[1][0], x[1][1]))  # Sort by (y, x)
@@ -548,6 +551,11 @@ def overlay_and_find_nodes_with_connected_regions(masked_edges, components, test
             if region in new_region_to_node:
                 new_region_to_node[region] = ground_node_id
 
+    if debugging:
+        # Drawn and saved on the writer's thread from the labels computed above
+        debug_writer.submit(image_file, render_regions, connected_edges, labeled_edges, region_slices, new_region_to_node,
+                            region_top_left, ground_regions, connection_points)
+
     # Create a new text file for node positions
     results_file = os.path.join(test_results_path, os.path.splitext(image_file)[0] + '.txt')
     with open(results_file, 'w') as results:
@@ -565,7 +573,7 @@ def overlay_and_find_nodes_with_connected_regions(masked_edges, components, test
                 if py >= labeled_edges.shape[0] or px >= labeled_edges.shape[1]:
                     continue
                 
-                is_connected, connection_point = is_point_connected_or_nearest(masked_edges, px, py)
+                is_connected, connection_point = is_point_connected_or_nearest(nearest_edge_index, px, py)
                 if is_connected:
                     connected_px, connected_py = connection_point
                     region = labeled_edges[connected_py, connected_px]  # Use the connected or nearest edge point
@@ -589,22 +597,26 @@ def overlay_and_find_nodes_with_connected_regions(masked_edges, components, test
                 # Write to the results file
                 results.write(f"{numbered_label} {' '.join(map(str, connected_nodes))}\n")
 
-def process_all_images(test_images_folder, model_path, output_files_path, test_results_path):
+def process_all_images(test_images_folder, model_path, output_files_path, test_results_path, max_snap_radius=None,
+                       debug_images=None, debug_sample_rate=0.0, archive_folder=None, archive_format="jsonl"):
+    # The debug images of the images named in debug_images, or of a debug_sample_rate share of
+    # them, are written to output_files_path in the background (see debug_artifacts.DebugArtifactWriter)
+    # The detections stay in memory, with archive_folder set they are also saved there in batches
+    # (see detection_archive.DetectionArchive)
     os.makedirs(output_files_path, exist_ok=True)
     os.makedirs(test_results_path, exist_ok=True)
 
-    model = YOLO(model_path)
+    model = load_model(model_path)
+    debug_writer = DebugArtifactWriter(output_files_path, debug_images, debug_sample_rate) \
+        if debug_images or debug_sample_rate > 0 else None
+    archive = DetectionArchive(archive_folder, archive_format) if archive_folder else None
 
     image_files = [f for f in os.listdir(test_images_folder) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
 
     for image_file in image_files:
         image_path = os.path.join(test_images_folder, image_file)
-        image_output_folder = os.path.join(output_files_path, os.path.splitext(image_file)[0])
-        os.makedirs(image_output_folder, exist_ok=True)
-
-        json_path = os.path.join(image_output_folder, 'circuit_info.json')
-
-        results = model(image_path)[0]
+        image = load_image(image_path)  # Decoded once and shared by the model and detect_edges
+        results = model(image)[0]
         circuit_info = []
 
         for result in results:
@@ -627,39 +639,39 @@ def process_all_images(test_images_folder, model_path, output_files_path, test_r
                     "connection_points": connection_points
                 })
 
-        with open(json_path, 'w') as json_file:
-            json.dump(circuit_info, json_file, indent=4)
-            
-        with open(json_path, "r") as json_file:
-            components = json.load(json_file)
+        if archive:
+            archive.add(image_file, circuit_info)  # Written in the background, used from memory here
 
-        connected_edges = detect_edges(image_path)
-        masked_edges = mask_components(connected_edges, components)
-        overlay_and_find_nodes_with_connected_regions(
-             masked_edges, components, test_results_path, image_file, output_files_path)
+        if debug_writer and debug_writer.wants(image_file):
+            debug_writer.submit(image_file, annotate_detections, image, circuit_info)
 
-if __name__ == '__main__':
-    parent_dir = os.path.dirname(os.getcwd()) # Parent directory
-    PROJECT_PATH = os.path.dirname(os.path.dirname(parent_dir))  # Project path is three levels up
-    pose_folder = os.path.join(PROJECT_PATH, 'Current trained model/pose')
-    train_folders = [folder for folder in os.listdir(pose_folder) if folder.startswith('train')]
+        connected_edges = detect_edges(image)
+        masked_edges = mask_components(connected_edges, circuit_info)
+        nearest_edge_index = NearestEdgeIndex(masked_edges, max_snap_radius)  # Built once per image
+        overlay_and_find_nodes_with_connected_regions(
+             connected_edges, masked_edges, nearest_edge_index, circuit_info, test_results_path, image_file, output_files_path, debug_writer)
 
-    # Check if there are train folders
-    if not train_folders:
-        raise FileNotFoundError("No 'train' folders found in the pose directory.")
+    if debug_writer:
+        debug_writer.close()
+    if archive:
+        archive.close()
 
-    # Determine the latest train folder
-    def extract_suffix(folder_name):
-        if folder_name == "train":
-            return 0
-        else:
-            return int(folder_name[5:])
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate the netlists of the test images with Method 2.")
+    parser.add_argument("--debug-images", nargs="+", help="test images (file names) to save debug images for")
+    parser.add_argument("--debug-sample-rate", type=float, default=0.0,
+                        help="share of the test images to save debug images for, 0 to 1")
+    parser.add_argument("--archive-detections", help="save the detections of the run to this folder, one file per batch")
+    parser.add_argument("--archive-format", choices=ARCHIVE_FORMATS, default="jsonl")
+    args = parser.parse_args()
 
-    latest_train_folder = max(train_folders, key=extract_suffix)
-    latest_train_path = os.path.join(pose_folder, latest_train_folder, 'weights', 'last.pt')
+    parent_dir = os.path.dirname(os.getcwd()) # Parent directory
+    latest_train_path = latest_train_weights()
 
     test_images_folder = os.path.join(parent_dir, 'Test images/')
     output_files_path = os.path.join(parent_dir, 'Method 2/Test outputs for debugging/')
     test_results_path = os.path.join(parent_dir, 'Method 2/Test results/')
 
-    process_all_images(test_images_folder, latest_train_path, output_files_path, test_results_path)
\ No newline at end of file
+    process_all_images(test_images_folder, latest_train_path, output_files_path, test_results_path,
+                       debug_images=args.debug_images, debug_sample_rate=args.debug_sample_rate,
+                       archive_folder=args.archive_detections, archive_format=args.archive_format)
\ No newline at end of file
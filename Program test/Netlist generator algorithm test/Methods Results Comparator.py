@@ -1,7 +1,15 @@
 import os
+import sys
+import json
+import time
+import logging
+import argparse
+from multiprocessing import Pool
 from collections import defaultdict, Counter
-from tkinter import Tk, filedialog
-from networkx.algorithms import isomorphism
+import numpy as np
+import networkx as nx
+
+logger = logging.getLogger(__name__)
 
 class Component:
     def __init__(self, name, nodes):
@@ -12,105 +20,222 @@ class Component:
         return f"{self.name} {self.nodes}"
 
 
-def is_set_match(ground_component, test_component):
+def component_type(component_name):
+    # Component names are the type followed by a number, e.g. Transistor_BJT_1
+    return component_name.rsplit('_', 1)[0]
+
+
+def netlist_graph(netlist, ordered_pins=False):
     """
-    Check if components have the same nodes regardless of order.
+    Bipartite graph of a netlist: a vertex per component labeled with its type, a vertex per
+    node, and an edge between a component and every node it connects to. The edge is labeled
+    with how many pins of the component are on the node, or with which pins if ordered_pins
+    (e.g. to tell a transistor's collector from its emitter).
     """
-    return set(ground_component.nodes) == set(test_component.nodes)
+    graph = nx.Graph()
+    for component in netlist:
+        graph.add_node(('component', component.name), label=component_type(component.name))
+        pins = defaultdict(list)
+        for pin, node in enumerate(component.nodes):
+            pins[node].append(pin)
+        for node, node_pins in pins.items():
+            graph.add_node(('node', node), label='node')
+            graph.add_edge(('component', component.name), ('node', node),
+                           pins=str(node_pins) if ordered_pins else str(len(node_pins)))
+    return graph
 
 
-def compare_netlists(ground_truth, test_netlist):
+class ComparisonTimeout(Exception):
+    pass
+
+
+def refine_colors(edges, colors, split, deadline=None):
     """
-    Compare two netlists to determine if they are equivalent.
+    Weisfeiler-Lehman color refinement of two graphs stored as one: vertices before split
+    belong to the first graph, the others to the second. Every vertex is repeatedly recolored
+    with its color and the multiset of its (edge label, neighbor color) pairs, until the
+    partition stops splitting. Isomorphic graphs end up with the same color counts, so
+    different counts prove the graphs are not isomorphic.
+    edges is (sources, targets, edge labels) with both directions of every edge, sorted by
+    source, colors the starting color of every vertex. The multisets are hashed with random
+    64 bit values, the colors stay a function of the graph structure even if two hashes
+    collide (the partition is then only coarser), so the check stays exact.
+    Returns the refined colors, or None if the graphs were told apart.
     """
-    locked_nodes = {}  # Tracks nodes that have been verified as correct
-    node_mapping = {}  # Tracks current mapping from test nodes to ground truth nodes
-    used_components = set()  # Tracks test components that are already matched
-
-    def backtrack(ground_truth_index, current_mapping, locked_nodes):
-        """
-        Recursive function to match ground truth components with test components.
-        """
-        if ground_truth_index >= len(ground_truth):
-            # All components have been successfully matched
-            return True
-
-        ground_truth_component = ground_truth[ground_truth_index]
-        print(f"\nProcessing ground truth component: {ground_truth_component}")
-
-        # Step 1: Check for set matches
-        for test_component in test_netlist:
-            if test_component in used_components:
-                continue  # Skip already used test components
-
-            print(f"Checking set match for test component: {test_component}")
-
-            if is_set_match(ground_truth_component, test_component):
-                print(f"Set match found: {ground_truth_component} == {test_component}")
-                # Mark as used
-                used_components.add(test_component)
-
-                # Add set match to node_mapping
-                original_mapping = current_mapping.copy()
-                for i in range(len(ground_truth_component.nodes)):
-                    ground_truth_node = ground_truth_component.nodes[i]
-                    current_mapping[ground_truth_node] = ground_truth_node
-
-                # Recurse to the next component
-                if backtrack(ground_truth_index + 1, current_mapping, locked_nodes):
-                    return True
-
-                # Revert changes if this path fails
-                print(f"Backtracking from set match: {ground_truth_component} and {test_component}")
-                current_mapping = original_mapping
-                used_components.remove(test_component)
-
-        # Step 2: Attempt dynamic mapping if no set match is found
-        for test_component in test_netlist:
-            if test_component in used_components:
-                continue  # Skip already used test components
-
-            print(f"Attempting dynamic mapping for test component: {test_component}")
-
-            if len(test_component.nodes) != len(ground_truth_component.nodes):
-                print(f"Skipping {test_component}: Node count mismatch with {ground_truth_component}")
-                continue  # Skip components with mismatched node counts
-
-            # Assume this test component matches (attempt dynamic mapping)
-            used_components.add(test_component)
-            original_mapping = current_mapping.copy()
-
-            # Try mapping this component's nodes
-            valid_mapping = True
-            for i in range(len(ground_truth_component.nodes)):
-                ground_truth_node = ground_truth_component.nodes[i]
-                test_node = test_component.nodes[i]
-
-                if ground_truth_node in locked_nodes:
-                    if locked_nodes[ground_truth_node] != test_node:
-                        print(f"Conflict in locked nodes: {ground_truth_node} -> {locked_nodes[ground_truth_node]} vs {test_node}")
-                        valid_mapping = False
-                        break  # Inconsistent mapping, skip this match
-
-                if ground_truth_node not in current_mapping:
-                    current_mapping[ground_truth_node] = test_node
-
-            if valid_mapping:
-                print(f"Dynamic mapping successful: {ground_truth_component} -> {test_component}")
-                # Recursive call to match the next component
-                if backtrack(ground_truth_index + 1, current_mapping, locked_nodes):
-                    return True
-
-            # Revert changes if this path fails
-            print(f"Backtracking from dynamic mapping: {ground_truth_component} and {test_component}")
-            current_mapping = original_mapping
-            used_components.remove(test_component)
-
-        return False  # No valid mapping found
-
-    # Main comparison loop
-    print("\nStarting netlist comparison...")
-    return backtrack(0, node_mapping, locked_nodes)
+    sources, targets, edge_labels = edges
+    vertex_count = len(colors)
+    colors = np.unique(colors, return_inverse=True)[1].reshape(-1)
+    class_count = int(colors.max()) + 1 if vertex_count else 0
+    random_values = np.random.default_rng(0).integers(0, 2 ** 63, (int(edge_labels.max(initial=0)) + 1) * vertex_count,
+                                                      dtype=np.uint64)
+    # Sums per source vertex over the sorted edges, vertices without edges keep 0
+    has_edges = np.bincount(sources, minlength=vertex_count) > 0
+    starts = np.searchsorted(sources, np.flatnonzero(has_edges))
+    while True:
+        if not np.array_equal(np.bincount(colors[:split], minlength=class_count),
+                              np.bincount(colors[split:], minlength=class_count)):
+            return None
+        if deadline is not None and time.perf_counter() > deadline:
+            raise ComparisonTimeout
+
+        neighborhood = np.zeros(vertex_count, np.uint64)
+        if len(starts):
+            neighborhood[has_edges] = np.add.reduceat(random_values[edge_labels * vertex_count + colors[targets]], starts)
+        refined = np.unique(colors.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + neighborhood,
+                            return_inverse=True)[1].reshape(-1)
+        refined_count = int(refined.max()) + 1 if vertex_count else 0
+        if refined_count == class_count:
+            return colors  # Stable partition, the color counts were compared when it last split
+        colors, class_count = refined, refined_count
+
+
+def match_vertices(adjacency, split, edges, colors, deadline=None):
+    """
+    Depth first search for an isomorphism between two graphs with refined colors (stored as
+    one, see refine_colors), mapping the first graph's vertices in breadth first order. Apart
+    from the first vertex of each connected part, the candidates are the same colored
+    neighbors of an already mapped neighbor's image.
+    When a vertex has several candidates, the chosen pair (and every pair mapped before it)
+    gets a color of its own and the colors are refined again before going deeper. This breaks
+    the symmetry of regular circuits (rings, meshes) at once, instead of finding a wrong choice
+    by backtracking from far down the search.
+    adjacency holds a dict (neighbor -> edge label) per vertex.
+    Returns the mapping (first graph vertex -> second graph vertex), or None.
+    """
+    # Breadth first order, each connected part starting from its vertex with the rarest color
+    class_sizes = np.bincount(colors)
+    order = []
+    parent = {}
+    for root in sorted(range(split), key=lambda vertex: class_sizes[colors[vertex]]):
+        if root in parent:
+            continue
+        parent[root] = None
+        order.append(root)
+        index = len(order) - 1
+        while index < len(order):
+            vertex = order[index]
+            for neighbor in adjacency[vertex]:
+                if neighbor not in parent:
+                    parent[neighbor] = vertex
+                    order.append(neighbor)
+            index += 1
+
+    mapping = {}
+    mapped_vertices = set()
+
+    def is_feasible(vertex, candidate):
+        # Edges to the mapped vertices must correspond one to one, with the same pins
+        mapped_neighbors = 0
+        for neighbor, pins in adjacency[vertex].items():
+            if neighbor in mapping:
+                if adjacency[candidate].get(mapping[neighbor]) != pins:
+                    return False
+                mapped_neighbors += 1
+        return mapped_neighbors == sum(neighbor in mapped_vertices for neighbor in adjacency[candidate])
+
+    def individualize(colors):
+        # Every mapped pair gets a color of its own, then the colors are refined from there
+        colors = colors.copy()
+        pair_colors = np.arange(len(mapping)) + colors.max() + 1
+        colors[list(mapping)] = pair_colors
+        colors[list(mapping.values())] = pair_colors
+        return refine_colors(edges, colors, split, deadline)
+
+    levels = []  # Per mapped vertex: its untried candidates, the colors they were picked with, whether to refine
+
+    def open_level(colors):
+        vertex = order[len(levels)]
+        if parent[vertex] is None:
+            pool = (np.flatnonzero(colors[split:] == colors[vertex]) + split).tolist()
+        else:
+            pool = [neighbor for neighbor in adjacency[mapping[parent[vertex]]] if colors[neighbor] == colors[vertex]]
+        pool = [candidate for candidate in pool if candidate not in mapped_vertices]
+        levels.append((iter(pool), colors, len(pool) > 1))
+
+    if order:
+        open_level(colors)
+    steps = 0
+    while levels:
+        steps += 1
+        if deadline is not None and steps % 64 == 0 and time.perf_counter() > deadline:
+            raise ComparisonTimeout
+
+        vertex = order[len(levels) - 1]
+        untried, level_colors, ambiguous = levels[-1]
+        if vertex in mapping:  # Backtracked to this vertex, undo its previous choice
+            mapped_vertices.remove(mapping.pop(vertex))
+
+        next_colors = None
+        for candidate in untried:
+            if not is_feasible(vertex, candidate):
+                continue
+            if not ambiguous:
+                next_colors = level_colors
+                break
+            mapping[vertex] = candidate
+            next_colors = individualize(level_colors)
+            del mapping[vertex]
+            if next_colors is not None:
+                break
+        if next_colors is None:
+            levels.pop()
+            continue
+
+        mapping[vertex] = candidate
+        mapped_vertices.add(candidate)
+        if len(mapping) == len(order):
+            return mapping
+        open_level(next_colors)
+
+    return mapping if not order else None
+
+
+def compare_netlists(ground_truth, test_netlist, ordered_pins=False, time_limit=None):
+    """
+    Check if two netlists are equivalent: the same circuit up to the numbering of the nodes
+    and components, i.e. their netlist graphs are isomorphic.
+    Cheap invariants and color refinement reject most differing netlists without a search,
+    a color constrained search confirms the rest.
+    Returns True or False, or None if no answer was found within time_limit seconds.
+    """
+    if Counter(component_type(component.name) for component in ground_truth) != \
+            Counter(component_type(component.name) for component in test_netlist):
+        return False
+
+    ground_truth_graph = netlist_graph(ground_truth, ordered_pins)
+    test_graph = netlist_graph(test_netlist, ordered_pins)
+    if ground_truth_graph.number_of_nodes() != test_graph.number_of_nodes() or \
+            ground_truth_graph.number_of_edges() != test_graph.number_of_edges():
+        return False
+
+    # Refinement can't tell e.g. one long loop from two shorter ones, the connected parts can
+    if sorted(map(len, nx.connected_components(ground_truth_graph))) != \
+            sorted(map(len, nx.connected_components(test_graph))):
+        return False
+
+    # Both graphs as one with integer vertices, the ground truth first, and integer labels
+    split = ground_truth_graph.number_of_nodes()
+    index = [{vertex: position for position, vertex in enumerate(ground_truth_graph)},
+             {vertex: position + split for position, vertex in enumerate(test_graph)}]
+    labels = {}
+    adjacency = [{index[side][neighbor]: labels.setdefault(attributes['pins'], len(labels))
+                  for neighbor, attributes in graph.adj[vertex].items()}
+                 for side, graph in enumerate((ground_truth_graph, test_graph)) for vertex in graph]
+    edges = [np.array(values, np.int64).reshape(-1) for values in
+             zip(*[(vertex, neighbor, pins) for vertex, neighbors in enumerate(adjacency)
+                   for neighbor, pins in neighbors.items()])] or [np.zeros(0, np.int64)] * 3
+    vertex_labels = {}
+    colors = np.array([vertex_labels.setdefault(label, len(vertex_labels))
+                       for graph in (ground_truth_graph, test_graph) for _, label in graph.nodes(data='label')], np.int64)
+
+    deadline = time.perf_counter() + time_limit if time_limit is not None else None
+    try:
+        colors = refine_colors(edges, colors, split, deadline)
+        if colors is None:
+            return False
+        return match_vertices(adjacency, split, edges, colors, deadline) is not None
+    except ComparisonTimeout:
+        return None
 
 
 def read_netlist(file_path):
@@ -121,6 +246,8 @@ def read_netlist(file_path):
     with open(file_path, 'r') as file:
         for line in file:
             parts = line.strip().split()
+            if not parts:
+                continue  # Blank line
             name = parts[0]
             nodes = list(map(int, parts[1:]))
             components.append(Component(name, nodes))
@@ -136,14 +263,16 @@ def parse_netlist(file_content):
 
     for line in file_content.strip().split("\n"):
         parts = line.split()
+        if not parts:
+            continue  # Blank line or empty netlist
         component = parts[0]
         connections = list(map(int, parts[1:]))
         component_to_nodes[component] = connections
         for node in connections:
             node_to_components[node].append(component)
 
-    print(f"Parsed components to nodes: {component_to_nodes}")  # Debug: Components and nodes
-    print(f"Parsed nodes to components: {node_to_components}")  # Debug: Nodes and their associated components
+    logger.debug("Parsed components to nodes: %s", component_to_nodes)
+    logger.debug("Parsed nodes to components: %s", dict(node_to_components))
 
     return component_to_nodes, node_to_components
 
@@ -165,13 +294,36 @@ def count_component_types(node_to_components):
         node_component_type_counts[node] = component_type_counts
     return node_component_type_counts
 
+def node_signature(component_type_counts):
+    """
+    Hashable signature of a node: its sorted multiset of connected component types.
+    The node degree is part of it, as the sum of the counts.
+    """
+    return tuple(sorted(component_type_counts.items()))
+
+def count_matched_nodes(correct_node_map, generated_node_map):
+    """
+    Number of correct nodes matched one-to-one by a generated node with the same signature.
+    The generated signatures are counted in a multiset, so matching takes linear time and every
+    generated node matches at most one correct node.
+    """
+    available_signatures = Counter(node_signature(counts) for counts in generated_node_map.values())
+
+    matched_nodes = 0
+    for correct_counts in correct_node_map.values():
+        signature = node_signature(correct_counts)
+        if available_signatures[signature] > 0:
+            available_signatures[signature] -= 1
+            matched_nodes += 1
+    return matched_nodes
+
 # Process two netlist files and calculate type counts
 def process_netlist_files(folder_path, correct_results_folder, filename):
     generated_file_path = os.path.join(folder_path, filename)
     correct_file_path = os.path.join(correct_results_folder, filename)
 
     if not os.path.exists(correct_file_path):
-        print(f"Skipping {filename}: Correct file not found.")
+        logger.warning("Skipping %s: Correct file not found.", filename)
         return None, None
 
     # Read the netlist files
@@ -193,19 +345,8 @@ def process_netlist_files(folder_path, correct_results_folder, filename):
 
 # Check netlist equivalence and calculate metrics
 def check_netlist_equivalence_by_type(correct_node_map, generated_node_map, num_files = 0, verbose=True):
-    matched_nodes = 0
-    false_generated_nodes = 0
-
-    # Calculate matched nodes and false generated nodes
-    for correct_node, correct_counts in correct_node_map.items():
-        matched = False
-        for generated_node, generated_counts in generated_node_map.items():
-            if correct_counts == generated_counts:
-                matched = True
-                matched_nodes += 1
-                break
-        if not matched:
-            false_generated_nodes += 1
+    # Calculate matched nodes
+    matched_nodes = count_matched_nodes(correct_node_map, generated_node_map)
 
     # Calculate the remaining metrics
     total_correct_nodes = len(correct_node_map)
@@ -335,7 +476,8 @@ def test_method_on_one_netlist(method_test_results_path):
     current_dir = os.getcwd()
     correct_results_folder = os.path.join(current_dir, 'Correct netlist results/')
 
-    # Open a file selection dialog for the user
+    # Open a file selection dialog for the user, tkinter is only needed here (headless runs may not have it)
+    from tkinter import Tk, filedialog
     print("Please select a file from the Test Results folder.")
     root = Tk()
     root.withdraw()  # Hide the main Tkinter window
@@ -371,17 +513,10 @@ def test_method_on_one_netlist(method_test_results_path):
         return
 
     # Calculate metrics
-    matched_nodes = 0
+    matched_nodes = count_matched_nodes(correct_node_type_counts, generated_node_type_counts)
     total_generated_nodes = len(generated_node_type_counts)
     total_correct_nodes = len(correct_node_type_counts)
 
-    # Calculate matched nodes and false nodes
-    for correct_node, correct_counts in correct_node_type_counts.items():
-        for generated_node, generated_counts in generated_node_type_counts.items():
-            if correct_counts == generated_counts:
-                matched_nodes += 1
-                break
-
     false_nodes_generated = total_generated_nodes - matched_nodes
 
     # Calculate accuracy with false nodes penalty
@@ -395,8 +530,118 @@ def test_method_on_one_netlist(method_test_results_path):
     print(f"Total Nodes in Correct Netlist: {total_correct_nodes}")
     print(f"Total False Nodes Generated: {false_nodes_generated}\n")
 
+# Headless evaluation: scores result folders in a process pool and streams JSON lines
+def configure_logging(level):
+    # Also the pool initializer, so debug output of the workers follows the requested level
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(processName)s: %(message)s")
+    logger.setLevel(level)
+
+def score_netlist_file(task):
+    """
+    Metrics of one generated netlist against its correct netlist, for evaluate_folders.
+    task is (results folder, correct results folder, file name, check equivalence, time limit
+    of the equivalence check in seconds). A check over the limit is reported as "undetermined".
+    """
+    results_folder, correct_results_folder, filename, check_equivalence, time_limit = task
+    metrics = {"results": results_folder, "file": filename}
+    try:
+        correct_node_type_counts, generated_node_type_counts = process_netlist_files(results_folder,
+                                                                                     correct_results_folder, filename)
+        if correct_node_type_counts is None:
+            metrics["error"] = "correct file not found"
+            return metrics
+
+        matched_nodes = count_matched_nodes(correct_node_type_counts, generated_node_type_counts)
+        false_nodes = len(generated_node_type_counts) - matched_nodes
+        metrics.update({
+            "correct_nodes": len(correct_node_type_counts),
+            "generated_nodes": len(generated_node_type_counts),
+            "matched_nodes": matched_nodes,
+            "false_nodes": false_nodes,
+            "accuracy": round(matched_nodes / (len(correct_node_type_counts) + false_nodes) * 100, 2)
+            if correct_node_type_counts else 0,
+        })
+        if check_equivalence:
+            equivalent = compare_netlists(read_netlist(os.path.join(correct_results_folder, filename)),
+                                          read_netlist(os.path.join(results_folder, filename)), time_limit=time_limit)
+            metrics["equivalent"] = "undetermined" if equivalent is None else equivalent
+    except Exception as error:
+        metrics["error"] = f"{type(error).__name__}: {error}"  # One unreadable file doesn't stop the run
+        logger.warning("Could not score %s in %s: %s", filename, results_folder, metrics["error"])
+        return metrics
+
+    logger.debug("Scored %s", metrics)
+    return metrics
+
+def evaluate_folders(results_folders, correct_results_folder, output=sys.stdout, processes=None,
+                     check_equivalence=False, chunksize=16, time_limit=None):
+    """
+    Scores every netlist of the result folders against the correct netlists without any prompt.
+    The metrics of each file are written to output as a JSON line as soon as they are ready
+    (in completion order), followed by a summary line per result folder. Equivalence checks
+    that take longer than time_limit seconds are counted as undetermined.
+    Returns the summaries, keyed by result folder.
+    """
+    tasks = [(results_folder, correct_results_folder, filename, check_equivalence, time_limit)
+             for results_folder in results_folders
+             for filename in sorted(os.listdir(results_folder)) if filename.endswith(".txt")]
+
+    summaries = {results_folder: Counter() for results_folder in results_folders}
+    with Pool(processes, initializer=configure_logging, initargs=(logger.getEffectiveLevel(),)) as pool:
+        for metrics in pool.imap_unordered(score_netlist_file, tasks, chunksize):
+            output.write(json.dumps(metrics) + "\n")
+            output.flush()
+
+            summary = summaries[metrics["results"]]
+            if "error" in metrics:
+                summary["errors"] += 1
+                continue
+            summary["files"] += 1
+            for metric in ("correct_nodes", "generated_nodes", "matched_nodes", "false_nodes"):
+                summary[metric] += metrics[metric]
+            if metrics.get("equivalent") == "undetermined":
+                summary["undetermined"] += 1
+            elif "equivalent" in metrics:
+                summary["equivalent"] += metrics["equivalent"]
+
+    for results_folder, summary in summaries.items():
+        summary = dict(summary)
+        denominator = summary.get("correct_nodes", 0) + summary.get("false_nodes", 0)
+        summary["accuracy"] = round(summary.get("matched_nodes", 0) / denominator * 100, 2) if denominator else 0
+        summaries[results_folder] = summary
+        output.write(json.dumps({"results": results_folder, "summary": summary}) + "\n")
+    output.flush()
+
+    return summaries
+
 # Main Function
 def main():
+    parser = argparse.ArgumentParser(description="Score generated netlists against the correct netlists. "
+                                                 "Without --results an interactive menu is shown.")
+    parser.add_argument("--results", nargs="+", help="result folders to score without any prompt")
+    parser.add_argument("--correct", default=os.path.join(os.getcwd(), 'Correct netlist results/'),
+                        help="folder of the correct netlists")
+    parser.add_argument("--output", help="JSON lines file for the metrics (standard output by default)")
+    parser.add_argument("--processes", type=int, help="worker processes (all CPUs by default)")
+    parser.add_argument("--equivalence", action="store_true",
+                        help="also check whether each netlist is exactly equivalent to the correct one")
+    parser.add_argument("--time-limit", type=float, default=10,
+                        help="seconds per file for the equivalence check, slower files are reported as undetermined")
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="log messages of this level and above are written to standard error")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    if args.results:
+        if args.output:
+            with open(args.output, 'w') as output:
+                evaluate_folders(args.results, args.correct, output, args.processes, args.equivalence,
+                                 time_limit=args.time_limit)
+        else:
+            evaluate_folders(args.results, args.correct, sys.stdout, args.processes, args.equivalence,
+                             time_limit=args.time_limit)
+        return
+
     # Function to get the method choice from the user
     def get_method_choice():
         current_dir = os.getcwd()
@@ -440,8 +685,8 @@ def main():
                 print(f"\nComparing: {file_name}\n")
                 ground_truth = ground_truth_files[file_name]
                 test_netlist = test_netlist_files[file_name]
-                print(f"Ground Truth: {ground_truth}")
-                print(f"Test Netlist: {test_netlist}")
+                logger.debug("Ground Truth: %s", ground_truth)
+                logger.debug("Test Netlist: %s", test_netlist)
                 result = compare_netlists(ground_truth, test_netlist)
                 print(f"\nMatch Result for {file_name}: {result}\n")
             else:
@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+import unittest
+from http.client import HTTPConnection
+
+# Helper modules live in the Program folder
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Project path is two levels up
+sys.path.append(os.path.join(PROJECT_PATH, 'Program'))
+from netlist_service import make_server
+
+class UnusedService:
+    # Requests with a bad Content-Length must be answered before the body reaches the service
+    def generate(self, image_data):
+        raise AssertionError("the service should not be called")
+
+class ContentLengthTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = make_server(UnusedService(), port=0)  # Any free port
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def post(self, content_length=None):
+        # Status of a POST /netlist sent with the given Content-Length header (none if None)
+        connection = HTTPConnection(*self.server.server_address, timeout=5)
+        try:
+            connection.putrequest("POST", "/netlist")
+            if content_length is not None:
+                connection.putheader("Content-Length", content_length)
+            connection.endheaders()
+            return connection.getresponse().status
+        finally:
+            connection.close()
+
+    def test_missing_length(self):
+        self.assertEqual(self.post(), 411)
+
+    def test_non_numeric_length(self):
+        self.assertEqual(self.post("abc"), 400)
+
+    def test_negative_length(self):
+        self.assertEqual(self.post("-1"), 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import cv2
+import numpy as np
+import scipy
+
+# Helper modules live in the Program folder
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Project path is two levels up
+sys.path.append(os.path.join(PROJECT_PATH, 'Program'))
+from image_loading import load_image, to_model_input
+from nearest_edge import NearestEdgeIndex
+from netlist_generator import (TextFileSink, detect_edges, mask_components, label_regions, find_region_top_left,
+                               resolve_connection_points, build_netlist)
+from netlist_comparator import load_comparator
+from model_engines import ENGINES
+from synthetic_schematics import generate_schematic, write_schematic
+
+RESULTS_FILE = os.path.join(PROJECT_PATH, 'Program test/Pipeline benchmark/Pipeline benchmark results.json')
+STAGES = ["decode", "inference", "edges", "mask", "label", "nearest_edge", "nodes", "write"]
+
+def time_pipeline(image_path, circuit_info, results_folder, model=None):
+    """
+    Runs the netlist pipeline once on a saved schematic and times each stage in milliseconds.
+    The post-processing uses the generated detections, so the netlist can be checked against
+    the ground truth whatever the model detects on synthetic symbols; the model (if any) is
+    only timed.
+    Returns the stage times, the counts of the run and the netlist.
+    """
+    stage_ms = {}
+
+    def timed(stage, function, *args):
+        start_time = time.perf_counter()
+        result = function(*args)
+        stage_ms[stage] = (time.perf_counter() - start_time) * 1000
+        return result
+
+    image = timed("decode", load_image, image_path)
+    if model is not None:
+        timed("inference", lambda: model(to_model_input(image), verbose=False))
+    connected_edges = timed("edges", detect_edges, image)
+    masked_edges = timed("mask", mask_components, connected_edges, circuit_info)
+    labeled_edges, region_stats = timed("label", label_regions, masked_edges)
+    connection_table = timed("nearest_edge", lambda: resolve_connection_points(labeled_edges, NearestEdgeIndex(masked_edges),
+                                                                               circuit_info))
+
+    def number_nodes():
+        region_top_left = find_region_top_left(labeled_edges, region_stats, dict.fromkeys(connection_table["region"].tolist()))
+        return build_netlist(connection_table, region_top_left, circuit_info)
+
+    netlist = timed("nodes", number_nodes)
+    timed("write", TextFileSink(results_folder).write, os.path.basename(image_path), netlist)
+
+    counts = {
+        "pixels": int(image.shape[0] * image.shape[1]),
+        "components": len(circuit_info),
+        "edge_pixels": int(np.count_nonzero(masked_edges)),
+        "regions": int(region_stats.shape[0] - 1),  # Without the background
+        "keypoints": int(connection_table.shape[0]),
+        "nodes": len(set(node for component in netlist.components for node in component.nodes)),
+    }
+    return stage_ms, counts, netlist
+
+def run_benchmark(sizes, components_per_megapixel=10, wire_density=0.5, noise=0.0, repeats=3, image_format="png",
+                  model=None, seed=0):
+    """
+    Generates a square synthetic schematic for each size (in pixels per side) and times the
+    pipeline stages on it. Returns one result per size: the median and fastest time of each
+    stage, the counts and whether the netlist matches the ground truth.
+    """
+    comparator = load_comparator()
+
+    def parse(netlist_text):
+        return [comparator.Component(line.split()[0], list(map(int, line.split()[1:])))
+                for line in netlist_text.splitlines() if line.strip()]
+
+    work_folder = tempfile.mkdtemp()
+    results = []
+    try:
+        for size in sizes:
+            component_count = max(2, round(components_per_megapixel * size * size / 1e6))
+            image, circuit_info, ground_truth = generate_schematic(component_count, size, size, wire_density, noise, seed)
+            image_path = write_schematic(work_folder, f"synthetic_{size}", image, circuit_info, ground_truth, image_format)
+            del image
+
+            stage_times = {}
+            for _ in range(repeats):
+                stage_ms, counts, netlist = time_pipeline(image_path, circuit_info, work_folder, model)
+                for stage, milliseconds in stage_ms.items():
+                    stage_times.setdefault(stage, []).append(milliseconds)
+
+            stages = {stage: {"median_ms": round(float(np.median(stage_times[stage])), 3),
+                              "min_ms": round(float(np.min(stage_times[stage])), 3)}
+                      for stage in STAGES if stage in stage_times}
+            results.append({
+                "size": size,
+                "counts": counts,
+                "stages": stages,
+                "total_median_ms": round(sum(stage["median_ms"] for stage in stages.values()), 3),
+                "correct": comparator.compare_netlists(parse(ground_truth), parse(netlist.to_text())),
+            })
+            print(f"{size:>6} px {component_count:>6} components {results[-1]['total_median_ms']:>10.1f} ms"
+                  f"{'' if results[-1]['correct'] else '  (netlist differs from the ground truth)'}")
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    return results
+
+def find_regressions(results, baseline, tolerance=0.2, min_ms=1.0):
+    """
+    Compares the stage medians with a saved baseline of the same sizes. A stage regresses when
+    it is more than tolerance (a fraction) slower and more than min_ms slower in absolute terms,
+    which keeps the noise of sub-millisecond stages out.
+    Returns one message per regression.
+    """
+    baseline_results = {result["size"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get(result["size"])
+        if baseline_result is None:
+            continue
+        for stage, timing in result["stages"].items():
+            baseline_ms = baseline_result["stages"].get(stage, {}).get("median_ms")
+            if baseline_ms is not None and timing["median_ms"] > baseline_ms * (1 + tolerance) and \
+                    timing["median_ms"] - baseline_ms > min_ms:
+                regressions.append(f"{result['size']} px {stage}: {timing['median_ms']:.1f} ms "
+                                   f"(baseline {baseline_ms:.1f} ms)")
+        if baseline_result.get("correct") and not result["correct"]:
+            regressions.append(f"{result['size']} px: netlist no longer matches the ground truth")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each pipeline stage on synthetic schematics of growing size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 4000],
+                        help="image sizes in pixels per side, e.g. up to 10000")
+    parser.add_argument("--components-per-megapixel", type=float, default=10)
+    parser.add_argument("--wire-density", type=float, default=0.5, help="probability of a wire between two rows")
+    parser.add_argument("--noise", type=float, default=0.0, help="pixel noise and specks, 0 to 1")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per size")
+    parser.add_argument("--format", default="png", choices=["png", "jpg"], help="image file format decoded")
+    parser.add_argument("--inference", action="store_true", help="also time the latest trained model")
+    parser.add_argument("--engine", choices=ENGINES, default="pytorch", help="inference runtime for --inference")
+    parser.add_argument("--output", default=RESULTS_FILE, help="where to save the results")
+    parser.add_argument("--baseline", help="results of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="accepted slowdown per stage, as a fraction")
+    args = parser.parse_args()
+
+    model = None
+    if args.inference:
+        from model_registry import latest_train_weights
+        from model_engines import load_model
+        model = load_model(latest_train_weights(), args.engine)
+
+    results = run_benchmark(args.sizes, args.components_per_megapixel, args.wire_density, args.noise, args.repeats,
+                            args.format, model)
+
+    report = {
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "opencv": cv2.__version__,
+                        "scipy": scipy.__version__, "machine": platform.machine(), "cpus": os.cpu_count()},
+        "parameters": {"components_per_megapixel": args.components_per_megapixel, "wire_density": args.wire_density,
+                       "noise": args.noise, "repeats": args.repeats, "format": args.format,
+                       "engine": args.engine if args.inference else None},
+        "results": results,
+    }
+
+    print(f"\n{'Size':>6} " + " ".join(f"{stage:>12}" for stage in STAGES))
+    for result in results:
+        print(f"{result['size']:>6} " + " ".join(f"{result['stages'][stage]['median_ms']:>12.1f}" if stage in result['stages']
+                                                  else f"{'-':>12}" for stage in STAGES))
+
+    with open(args.output, 'w') as results_file:
+        json.dump(report, results_file, indent=4)
+    print(f"\nResults saved to: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["parameters"] != report["parameters"]:
+            print("Note: the baseline was run with other parameters, the times may not be comparable.")
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+if __name__ == '__main__':
+    main()
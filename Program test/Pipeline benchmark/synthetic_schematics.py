@@ -0,0 +1,165 @@
+import os
+import json
+import math
+import argparse
+import cv2
+import numpy as np
+
+# Two terminal classes of the model, drawn with a simple symbol each
+COMPONENT_LABELS = ["Resistor", "Capacitor", "Inductor", "Voltage_src", "Current_src"]
+
+class NodeUnion:
+    # Union-find of the wire segments, two segments joined by a wire are the same node
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, node):
+        self.parent.setdefault(node, node)
+        while self.parent[node] != node:
+            self.parent[node] = self.parent[self.parent[node]]
+            node = self.parent[node]
+        return node
+
+    def union(self, node_a, node_b):
+        self.parent[self.find(node_a)] = self.find(node_b)
+
+def draw_symbol(image, label, bounding_box, thickness):
+    x1, y1, x2, y2 = bounding_box
+    center_y = (y1 + y2) // 2
+    if label == "Resistor":
+        # Zigzag between the two pins
+        xs = np.linspace(x1, x2, 9).astype(int)
+        ys = [center_y] + [y1 if i % 2 else y2 for i in range(1, 8)] + [center_y]
+        cv2.polylines(image, [np.array(list(zip(xs, ys)), np.int32)], False, (0, 0, 0), thickness)
+    elif label == "Capacitor":
+        center_x = (x1 + x2) // 2
+        gap = max(2, (x2 - x1) // 8)
+        cv2.line(image, (x1, center_y), (center_x - gap, center_y), (0, 0, 0), thickness)
+        cv2.line(image, (center_x + gap, center_y), (x2, center_y), (0, 0, 0), thickness)
+        cv2.line(image, (center_x - gap, y1), (center_x - gap, y2), (0, 0, 0), thickness)
+        cv2.line(image, (center_x + gap, y1), (center_x + gap, y2), (0, 0, 0), thickness)
+    elif label == "Inductor":
+        radius = max(2, (x2 - x1) // 8)
+        for turn in range(4):
+            cv2.ellipse(image, (x1 + radius * (2 * turn + 1), center_y), (radius, radius), 0, 180, 360,
+                        (0, 0, 0), thickness)
+    else:
+        # Sources: a circle with an arrow (current) or a plus sign (voltage)
+        center_x = (x1 + x2) // 2
+        radius = max(3, min(x2 - x1, y2 - y1) // 2)
+        cv2.circle(image, (center_x, center_y), radius, (0, 0, 0), thickness)
+        cv2.line(image, (x1, center_y), (center_x - radius, center_y), (0, 0, 0), thickness)
+        cv2.line(image, (center_x + radius, center_y), (x2, center_y), (0, 0, 0), thickness)
+        if label == "Current_src":
+            cv2.arrowedLine(image, (center_x - radius // 2, center_y), (center_x + radius // 2, center_y),
+                            (0, 0, 0), thickness)
+        else:
+            cv2.line(image, (center_x - radius // 3, center_y - radius // 2), (center_x + radius // 3, center_y - radius // 2),
+                     (0, 0, 0), thickness)
+
+def generate_schematic(component_count=20, width=2000, height=1500, wire_density=0.5, noise=0.0, seed=0):
+    """
+    Renders a synthetic schematic with a known netlist.
+    The components are laid out on a grid, each row a chain of components in series. The wire
+    between two neighbors in a row is one node, and with probability wire_density it is joined
+    by a vertical wire to the node below it. noise (0 to 1) adds gaussian pixel noise and specks.
+    Returns the BGR image, the detections in the format of netlist_generator.extract_circuit_info
+    and the ground truth netlist text.
+    """
+    rng = np.random.default_rng(seed)
+    columns = max(1, math.ceil(math.sqrt(component_count * width / height)))
+    rows = math.ceil(component_count / columns)
+    cell_width, cell_height = width / columns, height / rows
+    thickness = max(1, int(min(cell_width, cell_height) / 60))
+
+    image = np.full((height, width, 3), 255, np.uint8)
+    circuit_info = []
+    nodes = NodeUnion()
+    component_nodes = []
+
+    def gap_x(row_length, gap):
+        # x of the wire between the components gap - 1 and gap of a row, the row ends have stubs
+        if gap == 0:
+            return int(0.1 * cell_width)
+        if gap == row_length:
+            return int((row_length - 0.1) * cell_width)
+        return int(gap * cell_width)
+
+    row_lengths = [min(columns, component_count - row * columns) for row in range(rows)]
+    for row, row_length in enumerate(row_lengths):
+        center_y = int((row + 0.5) * cell_height)
+        for column in range(row_length):
+            label = COMPONENT_LABELS[rng.integers(len(COMPONENT_LABELS))]
+            center_x = int((column + 0.5) * cell_width)
+            half_width, half_height = int(0.2 * cell_width), int(0.15 * cell_height)
+            bounding_box = [center_x - half_width, center_y - half_height, center_x + half_width, center_y + half_height]
+            draw_symbol(image, label, bounding_box, thickness)
+
+            # Leads from the pins to the wires on both sides
+            left_x, right_x = bounding_box[0], bounding_box[2]
+            cv2.line(image, (gap_x(row_length, column), center_y), (left_x, center_y), (0, 0, 0), thickness)
+            cv2.line(image, (right_x, center_y), (gap_x(row_length, column + 1), center_y), (0, 0, 0), thickness)
+
+            circuit_info.append({"label": label, "bounding_box": bounding_box,
+                                 "connection_points": [[left_x, center_y], [right_x, center_y]]})
+            component_nodes.append([(row, column), (row, column + 1)])
+
+        # Vertical wires to the nodes of the next row
+        if row + 1 < rows:
+            next_center_y = int((row + 1.5) * cell_height)
+            for gap in range(min(row_length, row_lengths[row + 1]) + 1):
+                if rng.random() < wire_density and gap_x(row_length, gap) == gap_x(row_lengths[row + 1], gap):
+                    x = gap_x(row_length, gap)
+                    cv2.line(image, (x, center_y), (x, next_center_y), (0, 0, 0), thickness)
+                    nodes.union((row, gap), (row + 1, gap))
+
+    if noise > 0:
+        noisy = image.astype(np.int16) + rng.normal(0, 40 * noise, image.shape[:2])[..., None].astype(np.int16)
+        image = np.clip(noisy, 0, 255).astype(np.uint8)
+        speck_count = int(noise * width * height / 2000)
+        for x, y in zip(rng.integers(0, width, speck_count), rng.integers(0, height, speck_count)):
+            cv2.circle(image, (int(x), int(y)), thickness, (0, 0, 0), -1)
+
+    # Ground truth, numbered like the pipeline names components: per label, in detection order
+    node_ids = {}
+    label_counts = {}
+    lines = []
+    for component, pins in zip(circuit_info, component_nodes):
+        label_counts[component["label"]] = label_counts.get(component["label"], 0) + 1
+        pin_nodes = [node_ids.setdefault(nodes.find(pin), len(node_ids) + 1) for pin in pins]
+        lines.append(f"{component['label']}_{label_counts[component['label']]} {' '.join(map(str, pin_nodes))}\n")
+
+    return image, circuit_info, "".join(lines)
+
+def write_schematic(output_folder, name, image, circuit_info, netlist_text, image_format="png"):
+    # Saves <name>.<format>, its detections (<name>.json) and its ground truth netlist (<name>.txt)
+    os.makedirs(output_folder, exist_ok=True)
+    image_path = os.path.join(output_folder, f"{name}.{image_format}")
+    cv2.imwrite(image_path, image)
+    with open(os.path.join(output_folder, f"{name}.json"), 'w') as detections:
+        json.dump(circuit_info, detections)
+    with open(os.path.join(output_folder, f"{name}.txt"), 'w') as netlist:
+        netlist.write(netlist_text)
+    return image_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic schematics with their ground truth netlists.")
+    parser.add_argument("output", help="folder for the images, detections and netlists")
+    parser.add_argument("--count", type=int, default=10, help="number of schematics")
+    parser.add_argument("--components", type=int, default=20, help="components per schematic")
+    parser.add_argument("--width", type=int, default=2000)
+    parser.add_argument("--height", type=int, default=1500)
+    parser.add_argument("--wire-density", type=float, default=0.5, help="probability of a wire between two rows")
+    parser.add_argument("--noise", type=float, default=0.0, help="pixel noise and specks, 0 to 1")
+    parser.add_argument("--format", default="png", choices=["png", "jpg"], help="image file format")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for index in range(args.count):
+        image, circuit_info, netlist_text = generate_schematic(args.components, args.width, args.height,
+                                                              args.wire_density, args.noise, args.seed + index)
+        write_schematic(args.output, f"synthetic_{index:04d}", image, circuit_info, netlist_text, args.format)
+    print(f"{args.count} schematics written to {args.output}")
+
+if __name__ == '__main__':
+    main()
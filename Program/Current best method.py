@@ -1,186 +1,528 @@
 import os
-import cv2
-import numpy as np
-from ultralytics import YOLO
-from scipy.ndimage import label as connected_label
-from scipy.spatial import distance
-
-# Define helper functions
-def detect_edges(image_path):
-    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
-    grayscale = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(grayscale, 50, 150)
-    kernel = np.ones((5, 5), np.uint8)
-    connected_edges = cv2.dilate(edges, kernel, iterations=2)
-
-    return connected_edges
-
-def mask_components(connected_edges, components):
-    masked_edges = connected_edges.copy()
-    for component in components:
-        bbox = component["bounding_box"]
-        x1, y1, x2, y2 = bbox
-        cv2.rectangle(masked_edges, (x1, y1), (x2, y2), 0, -1)
-
-    return masked_edges
-
-def find_nearest_edge(masked_edges, px, py):
-    edge_points = np.argwhere(masked_edges > 0)  # Get all edge points
-    if edge_points.size == 0:
-        return None  # No edges in the mask
-    distances = distance.cdist([(py, px)], edge_points)  # Compute distances from the point to all edges
-    nearest_index = np.argmin(distances)  # Index of the nearest edge
-
-    return edge_points[nearest_index]  # Coordinates of the nearest edge (y, x)
-
-def is_point_connected_or_nearest(masked_edges, px, py):
-
-    # Find the nearest edge
-    nearest_edge = find_nearest_edge(masked_edges, px, py)
-    if nearest_edge is not None:
-        return True, (nearest_edge[1], nearest_edge[0])  # Return x, y of the nearest edge
-
-    print(f"No connection found for point ({px}, {py})")  # Debug message if something went wrong
-    return False, None  # No connection and no nearest edge
-
-def overlay_and_find_nodes_with_connected_regions(masked_edges, components, results_path, image_file):
-    labeled_edges, num_regions = connected_label(masked_edges)
-    region_to_node = {}
-    current_node_id = 1
-
-    for component in components:
-        for point in component["connection_points"]:
-            px, py = point
-            if py >= labeled_edges.shape[0] or px >= labeled_edges.shape[1]:
-                continue
-
-            is_connected, connection_point = is_point_connected_or_nearest(masked_edges, px, py)
-            if is_connected:
-                connected_px, connected_py = connection_point
-                region = labeled_edges[connected_py, connected_px]  # Use the connected or nearest edge point
-                if region > 0:
-                    if region not in region_to_node:
-                        region_to_node[region] = current_node_id
-                        current_node_id += 1
-
-    # Rearrange node IDs based on top-left-most pixel
-    region_top_left = {}
-    for region in range(1, num_regions + 1):
-        pixels = np.argwhere(labeled_edges == region)  # Get all pixels in the region
-        if len(pixels) > 0:
-            top_left_pixel = pixels[np.lexsort((pixels[:, 1], pixels[:, 0]))][0]  # Sort by (y, then x) and pick the first
-            region_top_left[region] = top_left_pixel
-
-    # Sort regions by top-left-most pixel
-    sorted_regions = sorted(region_top_left.items(), key=lambda x: (x[1][0], x[1][1]))  # Sort by (y, x)
-
-    # Reassign node IDs
-    new_region_to_node = {}
-    new_node_id = 1
-    for region, _ in sorted_regions:
-        if region in region_to_node:
-            new_region_to_node[region] = new_node_id
-            new_node_id += 1
-
-    # Create a new text file for node positions
-    results_file = os.path.join(results_path, os.path.splitext(image_file)[0] + '.txt')
-    with open(results_file, 'w') as results:
-        # Dictionary to keep track of label counts
-        label_counts = {}
-
-        for component in components:
-            # Skip GND components
-            if component["label"].upper() == "GND":
+import time
+import argparse
+from queue import SimpleQueue
+from collections import deque
+from multiprocessing import Pool
+from staged_pipeline import Stage, StagedPipeline
+from image_loading import load_image, to_model_input, to_grayscale
+from netlist_service import NetlistService, make_server
+from tiling import detect_tiled
+from model_registry import latest_train_weights
+from model_engines import ENGINES, LazyModel, load_model, model_key_path
+from result_cache import NetlistCache
+from job_manifest import JobManifest, MANIFEST_MODES, guarded_netlist_task
+from instrumentation import Instrumentation, METRICS_FORMATS
+from flight_recorder import FlightRecorder, PROFILERS
+from netlist_generator import extract_circuit_info, compute_netlist, compute_netlist_task, TextFileSink
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+class RunOptions:
+    """
+    Options of process_all_images, by the part of the run they change. Decoding: grayscale and
+    reduced_scale (see image_loading.load_image). Detection: engine (see model_engines.load_model),
+    batch_size, tile_size and tile_overlap (large sheets in tiles, see tiling.detect_tiled).
+    Post-processing: max_snap_radius, min_region_area, low_memory (see netlist_generator.Workspace),
+    track_memory (see netlist_generator.MemoryTracker) and postprocess_processes worker processes
+    fed chunksize images at a time, in input order unless ordered is False.
+    Optional services, off unless their path or budget is set: cache_dir (see
+    result_cache.NetlistCache), manifest_path (see job_manifest.JobManifest), metrics_path (see
+    instrumentation.Instrumentation) and latency_budget in seconds (see flight_recorder.FlightRecorder).
+    The pipelined, watch and serve modes only use the decoding options, engine, batch_size (pipelined),
+    max_snap_radius and min_region_area.
+    """
+    def __init__(self, max_snap_radius=None, min_region_area=0, batch_size=1, postprocess_processes=0, chunksize=1,
+                 ordered=True, grayscale=False, reduced_scale=1, tile_size=None, tile_overlap=256, low_memory=False,
+                 track_memory=False, engine="pytorch", cache_dir=None, cache_max_bytes=2 * 2 ** 30, manifest_path=None,
+                 manifest_mode="skip_completed", metrics_path=None, metrics_format="jsonl", latency_budget=None,
+                 recorder_folder="Flight recorder", recorder_max_records=20, recorder_profiler="sample"):
+        self.max_snap_radius = max_snap_radius
+        self.min_region_area = min_region_area
+        self.batch_size = batch_size
+        self.postprocess_processes = postprocess_processes
+        self.chunksize = chunksize
+        self.ordered = ordered
+        self.grayscale = grayscale
+        self.reduced_scale = reduced_scale
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.low_memory = low_memory
+        self.track_memory = track_memory
+        self.engine = engine
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.manifest_path = manifest_path
+        self.manifest_mode = manifest_mode
+        self.metrics_path = metrics_path
+        self.metrics_format = metrics_format
+        self.latency_budget = latency_budget
+        self.recorder_folder = recorder_folder
+        self.recorder_max_records = recorder_max_records
+        self.recorder_profiler = recorder_profiler
+
+def process_all_images(images_folder, model_path, results_path, options=None, sink=None):
+    """
+    Runs the model on every image in images_folder and passes one netlist per image to sink
+    (by default a TextFileSink writing <image name>.txt files to results_path).
+    Each image is decoded once and the same array is used for inference and edge detection.
+    options is a RunOptions, the defaults process the images one at a time in this process.
+    """
+    options = options or RunOptions()
+    sink = sink or TextFileSink(results_path)
+
+    model = LazyModel(model_path, options.engine)  # Not loaded at all if every image is served from the cache
+
+    image_files = [f for f in os.listdir(images_folder) if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+    manifest = JobManifest(options.manifest_path) if options.manifest_path else None
+    if manifest:
+        image_files = manifest.select(image_files, options.manifest_mode)
+
+    netlist_options = {"max_snap_radius": options.max_snap_radius, "min_region_area": options.min_region_area,
+                       "tile_size": options.tile_size, "low_memory": options.low_memory,
+                       "track_memory": options.track_memory}
+
+    instrumentation = None
+    if options.metrics_path:
+        instrumentation = Instrumentation(options.metrics_path, options.metrics_format)
+        netlist_options["trace"] = True
+
+    if options.latency_budget is not None:
+        netlist_options["flight_recorder"] = FlightRecorder(options.recorder_folder, options.latency_budget,
+                                                            options.recorder_max_records, options.recorder_profiler)
+
+    cache = None
+    if options.cache_dir:
+        detection_parameters = {"engine": options.engine, "grayscale": options.grayscale,
+                                "reduced_scale": options.reduced_scale, "tile_size": options.tile_size,
+                                "tile_overlap": options.tile_overlap if options.tile_size else None}
+        netlist_parameters = {"max_snap_radius": options.max_snap_radius, "min_region_area": options.min_region_area,
+                              "tile_size": options.tile_size}
+        cache = NetlistCache(options.cache_dir, model_key_path(model_path, options.engine), detection_parameters,
+                             netlist_parameters, options.cache_max_bytes)
+
+    peak_bytes = {}  # Stage -> largest peak over all images and processes
+
+    def write(image_file, netlist, task_peak_bytes=None, task_trace=None, cached=False):
+        if instrumentation:
+            trace = instrumentation.trace(image_file)
+            if task_trace is not None:
+                trace.merge(task_trace)  # Stages run by the worker, before the write
+            with trace.stage("write"):
+                sink.write(image_file, netlist)
+        else:
+            sink.write(image_file, netlist)
+        if cache and not cached:
+            cache.put_netlist(os.path.join(images_folder, image_file), netlist)
+        if manifest:
+            manifest.mark_done(image_file, netlist)
+        for stage, stage_bytes in (task_peak_bytes or {}).items():
+            peak_bytes[stage] = max(peak_bytes.get(stage, 0), stage_bytes)
+        if instrumentation:
+            instrumentation.finish(image_file, cached)
+
+    if cache:
+        # Unchanged images are served from the cache without being decoded
+        remaining_files = []
+        for image_file in image_files:
+            netlist = cache.get_netlist(os.path.join(images_folder, image_file))
+            if netlist is None:
+                remaining_files.append(image_file)
+            else:
+                if manifest:
+                    manifest.mark_started(image_file)
+                write(image_file, netlist, cached=True)
+        image_files = remaining_files
+
+    def detect(batch_files, batch_images):
+        # Detections of a batch of images, the model only runs on those missing from the cache
+        batch_detections = [cache.get_detections(os.path.join(images_folder, image_file)) if cache else None
+                            for image_file in batch_files]
+        missing = [index for index, circuit_info in enumerate(batch_detections) if circuit_info is None]
+        if not missing:
+            return batch_detections
+
+        if options.tile_size:
+            missing_detections = (detect_tiled(model, batch_images[index], options.tile_size, options.tile_overlap,
+                                               options.batch_size)
+                                  for index in missing)
+        else:
+            batch_inputs = [to_model_input(batch_images[index]) for index in missing]
+            missing_detections = (extract_circuit_info(results)
+                                  for results in model(batch_inputs, stream=True, batch=options.batch_size))
+
+        if instrumentation:
+            # The model runs on the whole batch, its time is shared evenly by the images of the batch
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            missing_detections = list(missing_detections)
+            wall_ms = (time.perf_counter() - wall_start) * 1000 / len(missing)
+            cpu_ms = (time.process_time() - cpu_start) * 1000 / len(missing)
+            for index in missing:
+                instrumentation.trace(batch_files[index]).add_stage("inference", wall_ms, cpu_ms)
+
+        for index, circuit_info in zip(missing, missing_detections):
+            batch_detections[index] = circuit_info
+            if cache:
+                cache.put_detections(os.path.join(images_folder, batch_files[index]), circuit_info)
+
+        return batch_detections
+
+    def record_failure(image_file, error):
+        # With a manifest, an image that fails is recorded and the run goes on
+        manifest.mark_failed(image_file, error)
+        print(f"Failed to process {image_file}: {error}")
+        if instrumentation:
+            instrumentation.discard(image_file)
+
+    def detect_or_record(batch_files, batch_images):
+        # detect, but without stopping a manifest run: a failed batch is retried one image at a time,
+        # and the images that still fail are recorded and left out (their detections are None)
+        try:
+            return detect(batch_files, batch_images)
+        except Exception as error:
+            if not manifest:
+                raise
+            if len(batch_files) == 1:
+                record_failure(batch_files[0], f"{type(error).__name__}: {error}")
+                return [None]
+
+        batch_detections = []
+        for image_file, image in zip(batch_files, batch_images):
+            try:
+                batch_detections += detect([image_file], [image])
+            except Exception as error:
+                record_failure(image_file, f"{type(error).__name__}: {error}")
+                batch_detections.append(None)
+        return batch_detections
+
+    def detection_tasks():
+        # Run the model on batch_size images at a time so that only the current batch is held in memory,
+        # large sheets are decoded one at a time and their tiles are batched instead
+        images_per_batch = 1 if options.tile_size else options.batch_size
+        for batch_start in range(0, len(image_files), images_per_batch):
+            batch_files, batch_images = [], []
+            for image_file in image_files[batch_start:batch_start + images_per_batch]:
+                if manifest:
+                    manifest.mark_started(image_file)
+                image_path = os.path.join(images_folder, image_file)
+                try:
+                    if instrumentation:
+                        with instrumentation.trace(image_file).stage("decode"):
+                            image = load_image(image_path, options.grayscale, options.reduced_scale)
+                    else:
+                        image = load_image(image_path, options.grayscale, options.reduced_scale)
+                except Exception as error:
+                    if not manifest:
+                        raise
+                    record_failure(image_file, f"{type(error).__name__}: {error}")
+                    continue
+                batch_files.append(image_file)
+                batch_images.append(image)
+            if not batch_files:
                 continue
 
-            connected_nodes = []
-            for point in component["connection_points"]:
-                px, py = point
-                if py >= labeled_edges.shape[0] or px >= labeled_edges.shape[1]:
+            for image_file, image, circuit_info in zip(batch_files, batch_images,
+                                                       detect_or_record(batch_files, batch_images)):
+                if circuit_info is None:
+                    continue  # Failed and recorded
+                # Only the grayscale image is needed from here on, which is also cheaper to send to workers
+                yield to_grayscale(image), circuit_info, image_file, netlist_options
+
+    # With a manifest, failed images are recorded and the run goes on
+    task_function = guarded_netlist_task if manifest else compute_netlist_task
+
+    def finish(result):
+        if manifest:
+            image_file, result, error = result
+            if error:
+                record_failure(image_file, error)
+                return
+        write(*result)
+
+    def task_chunks():
+        # chunksize tasks are sent to a worker at once
+        chunk = []
+        for task in detection_tasks():
+            chunk.append(task)
+            if len(chunk) == options.chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    if options.postprocess_processes > 0:
+        # Decoding, inference and the manifest and instrumentation updates stay on this thread, between
+        # handling results, with at most two chunks per worker waiting or running in the pool
+        max_chunks = 2 * options.postprocess_processes
+        with Pool(options.postprocess_processes) as pool:
+            if options.ordered:
+                pending = deque()
+                for chunk in task_chunks():
+                    pending.append(pool.map_async(task_function, chunk, len(chunk)))
+                    while len(pending) >= max_chunks or (pending and pending[0].ready()):
+                        for result in pending.popleft().get():
+                            finish(result)
+                for chunk_results in pending:
+                    for result in chunk_results.get():
+                        finish(result)
+            else:
+                done = SimpleQueue()  # Chunk results (or the exception of a failed chunk) as they complete
+                in_flight = 0
+
+                def finish_chunk():
+                    chunk_results = done.get()
+                    if isinstance(chunk_results, BaseException):
+                        raise chunk_results
+                    for result in chunk_results:
+                        finish(result)
+
+                for chunk in task_chunks():
+                    pool.map_async(task_function, chunk, len(chunk), callback=done.put, error_callback=done.put)
+                    in_flight += 1
+                    while in_flight >= max_chunks or (in_flight and not done.empty()):
+                        finish_chunk()
+                        in_flight -= 1
+                for _ in range(in_flight):
+                    finish_chunk()
+    else:
+        for task in detection_tasks():
+            finish(task_function(task))
+
+    if options.track_memory:
+        print("Peak bytes allocated per stage (Python and NumPy allocations):")
+        for stage, stage_bytes in peak_bytes.items():
+            print(f"  {stage}: {stage_bytes / 2 ** 20:.1f} MiB")
+
+    if manifest:
+        print(f"Manifest summary: {manifest.summary()}")
+        manifest.close()
+
+    if instrumentation:
+        instrumentation.close()
+
+def process_all_images_pipelined(images_folder, model_path, results_path, options=None, decode_workers=2,
+                                 postprocess_workers=4, queue_size=8, sink=None):
+    """
+    Same output as process_all_images, but decoding, inference and post-processing run as
+    overlapping stages connected by bounded queues (queue_size caps the images in flight).
+    Inference uses a single worker since the YOLO model is not safe to share across threads.
+    sink.write is called from several post-processing threads at once.
+    """
+    options = options or RunOptions()
+    sink = sink or TextFileSink(results_path)
+
+    model = load_model(model_path, options.engine)
+
+    image_files = [f for f in os.listdir(images_folder) if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+    def decode(image_file):
+        return image_file, load_image(os.path.join(images_folder, image_file), options.grayscale,
+                                      options.reduced_scale)
+
+    def infer(batch):
+        inputs = [to_model_input(image) for _, image in batch]
+        return [(image_file, image, extract_circuit_info(results))
+                for (image_file, image), results in zip(batch, model(inputs, batch=len(inputs)))]
+
+    def postprocess(item):
+        image_file, image, circuit_info = item
+        sink.write(image_file, compute_netlist(image, circuit_info, options.max_snap_radius, options.min_region_area))
+        return image_file
+
+    pipeline = StagedPipeline([
+        Stage("decode", decode, workers=decode_workers),
+        Stage("inference", infer, workers=1, batch_size=options.batch_size),
+        Stage("postprocess", postprocess, workers=postprocess_workers),
+    ], queue_size=queue_size)
+
+    for _ in pipeline.run(image_files):
+        pass
+
+def watch_folder(images_folder, model_path, results_path, options=None, poll_interval=1.0):
+    """
+    Keeps the model loaded and polls images_folder, generating a netlist for every new or
+    modified image. An image is only picked up once its size and modification time are
+    unchanged between two polls, so files still being copied in are not read half written.
+    Runs until interrupted with Ctrl+C.
+    """
+    options = options or RunOptions()
+    sink = TextFileSink(results_path)
+
+    model = load_model(model_path, options.engine)
+
+    processed = {}  # image_file -> (size, mtime) of the version already processed
+    pending = {}  # image_file -> (size, mtime) seen on the previous poll
+
+    # Images that already have an up to date netlist are not processed again
+    for image_file in os.listdir(images_folder):
+        if not image_file.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        results_file = os.path.join(results_path, os.path.splitext(image_file)[0] + '.txt')
+        image_stat = os.stat(os.path.join(images_folder, image_file))
+        if os.path.exists(results_file) and os.stat(results_file).st_mtime_ns >= image_stat.st_mtime_ns:
+            processed[image_file] = (image_stat.st_size, image_stat.st_mtime_ns)
+
+    print(f"Watching {images_folder} for new images (Ctrl+C to stop)")
+    try:
+        while True:
+            for image_file in sorted(os.listdir(images_folder)):
+                if not image_file.lower().endswith(IMAGE_EXTENSIONS):
                     continue
 
-                is_connected, connection_point = is_point_connected_or_nearest(masked_edges, px, py)
-                if is_connected:
-                    connected_px, connected_py = connection_point
-                    region = labeled_edges[connected_py, connected_px]  # Use the connected or nearest edge point
-                    if region > 0 and region in new_region_to_node:
-                        node_id = new_region_to_node[region]
-                        connected_nodes.append(node_id)
-
-            # Ensure we only write components that have at least one connected node
-            connected_nodes = list(set(connected_nodes))
-            if connected_nodes:  # Check if there are any connected nodes
-                unique_label = component["label"]
-
-                # Increment the count for the current label
-                if unique_label not in label_counts:
-                    label_counts[unique_label] = 0
-                label_counts[unique_label] += 1
-
-                # Create a new label with numbering
-                numbered_label = f"{unique_label}_{label_counts[unique_label]}"
-
-                # Write to the results file
-                results.write(f"{numbered_label} {' '.join(map(str, connected_nodes))}\n")
-
-def process_all_images(images_folder, model_path, results_path):
-    os.makedirs(results_path, exist_ok=True)
-
-    model = YOLO(model_path)
-
-    image_files = [f for f in os.listdir(images_folder) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-
-    for image_file in image_files:
-        image_path = os.path.join(images_folder, image_file)
+                image_path = os.path.join(images_folder, image_file)
+                try:
+                    image_stat = os.stat(image_path)
+                except FileNotFoundError:
+                    continue  # Removed since the listing
+                signature = (image_stat.st_size, image_stat.st_mtime_ns)
 
-        results = model(image_path)[0]
-        circuit_info = []
-
-        for result in results:
-            for cls, keypoints, bbox in zip(result.boxes.cls.cpu().numpy(),
-                                             result.keypoints.xy.cpu().numpy(),
-                                             result.boxes.xyxy.cpu().numpy()):
-                class_idx = int(cls)
-                object_name = results.names[class_idx]
-
-                x_min, y_min, x_max, y_max = map(int, bbox)
-                bounding_box = [x_min, y_min, x_max, y_max]
-
-                connection_points = [
-                    [int(point[0]), int(point[1])] for point in keypoints if not (point[0] == 0 and point[1] == 0)
-                ]
-
-                circuit_info.append({
-                    "label": object_name,
-                    "bounding_box": bounding_box,
-                    "connection_points": connection_points
-                })
-
-        connected_edges = detect_edges(image_path)
-        masked_edges = mask_components(connected_edges, circuit_info)
-        overlay_and_find_nodes_with_connected_regions(
-             masked_edges, circuit_info, results_path, image_file)
+                if processed.get(image_file) == signature:
+                    continue
+                if pending.get(image_file) != signature:
+                    pending[image_file] = signature  # New or still changing, check again on the next poll
+                    continue
+                del pending[image_file]
+                processed[image_file] = signature
+
+                start_time = time.perf_counter()
+                try:
+                    image = load_image(image_path, options.grayscale, options.reduced_scale)
+                    circuit_info = extract_circuit_info(model(to_model_input(image), verbose=False)[0])
+                    netlist = compute_netlist(image, circuit_info, options.max_snap_radius, options.min_region_area)
+                    sink.write(image_file, netlist)
+                except Exception as error:
+                    print(f"Failed to process {image_file}: {error}")
+                    continue
+                print(f"Processed {image_file} in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+def serve(model_path, options=None, host="127.0.0.1", port=8000, max_batch_size=8, max_wait=0.01):
+    """
+    Serves netlists over HTTP with the model kept loaded (see netlist_service.make_server).
+    Requests arriving within max_wait seconds of each other share one batched model call.
+    """
+    options = options or RunOptions()
+    model = load_model(model_path, options.engine)
+
+    def detect_batch(images):
+        inputs = [to_model_input(image) for image in images]
+        return [extract_circuit_info(results) for results in model(inputs, batch=len(inputs), verbose=False)]
+
+    def netlist_for(image, circuit_info):
+        return compute_netlist(image, circuit_info, options.max_snap_radius, options.min_region_area)
+
+    service = NetlistService(detect_batch, netlist_for, max_batch_size, max_wait, options.grayscale,
+                             options.reduced_scale)
+    server = make_server(service, host, port)
+    print(f"Serving netlists on http://{host}:{port}/netlist (stats on /stats, Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped serving.")
+    finally:
+        server.server_close()
 
 if __name__ == '__main__':
-    current_path = os.getcwd()
-    pose_folder = os.path.join(os.path.dirname(os.getcwd()), 'Current trained model/pose')
-    train_folders = [folder for folder in os.listdir(pose_folder) if folder.startswith('train')]
-
-    # Check if there are train folders
-    if not train_folders:
-        raise FileNotFoundError("No 'train' folders found in the pose directory.")
+    parser = argparse.ArgumentParser(description="Generate netlists for the images in the Images folder.")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep the model loaded and process new images as they arrive in the Images folder")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between folder scans in watch mode")
+    parser.add_argument("--serve", action="store_true", help="serve netlists over HTTP instead of processing the Images folder")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on in serve mode")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on in serve mode")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="largest batch of requests sent to the model at once")
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="how long a request waits for others to join its batch")
+    parser.add_argument("--max-snap-radius", type=float,
+                        help="largest distance in pixels a keypoint is moved to reach an edge (unlimited by default)")
+    parser.add_argument("--min-region-area", type=int, default=0,
+                        help="edge regions with fewer pixels are treated as noise and not numbered as nodes")
+    parser.add_argument("--batch-size", type=int, default=1, help="images (or tiles) sent to the model at once")
+    parser.add_argument("--grayscale", action="store_true", help="decode the images as grayscale")
+    parser.add_argument("--reduced-scale", type=int, choices=(1, 2, 4, 8), default=1,
+                        help="decode the images at 1/N of their size")
+    parser.add_argument("--postprocess-processes", type=int, default=0,
+                        help="worker processes for the edge, label and numbering work (0 runs it in this process)")
+    parser.add_argument("--chunksize", type=int, default=1, help="images sent to a post-processing worker at once")
+    parser.add_argument("--unordered", action="store_true",
+                        help="write the netlists as the workers finish them instead of in the order of the images")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="overlap decoding, inference and post-processing in threads connected by bounded queues")
+    parser.add_argument("--decode-workers", type=int, default=2, help="decoding threads in pipelined mode")
+    parser.add_argument("--postprocess-workers", type=int, default=4, help="post-processing threads in pipelined mode")
+    parser.add_argument("--queue-size", type=int, default=8, help="images in flight between stages in pipelined mode")
+    parser.add_argument("--tile-size", type=int, help="process large sheets in tiles of this many pixels")
+    parser.add_argument("--tile-overlap", type=int, default=256, help="overlap between detection tiles, larger than any component")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="reuse the edge and label buffers across images")
+    parser.add_argument("--track-memory", action="store_true",
+                        help="report the peak Python and NumPy allocation of each stage (slower, OpenCV's internal "
+                             "memory is not seen; --metrics records the process RSS instead)")
+    parser.add_argument("--engine", choices=ENGINES, default="pytorch", help="inference runtime for the model")
+    parser.add_argument("--cache-dir", help="cache detections and netlists in this folder and reuse them for unchanged images")
+    parser.add_argument("--cache-max-gb", type=float, default=2, help="size limit of the cache")
+    parser.add_argument("--manifest", help="record the status of every image in this SQLite file to make the run restartable")
+    parser.add_argument("--manifest-mode", choices=MANIFEST_MODES, default="skip_completed",
+                        help="images to process given the manifest: all but the finished ones, the never started or "
+                             "interrupted ones, the failed ones or all")
+    parser.add_argument("--metrics", help="save per image stage timings, peak memory and counts to this file")
+    parser.add_argument("--metrics-format", choices=METRICS_FORMATS, default="jsonl",
+                        help="JSON lines per image or a Prometheus text file summarizing the run")
+    parser.add_argument("--latency-budget-ms", type=float,
+                        help="save images whose post-processing takes longer, with their intermediate state and profile")
+    parser.add_argument("--recorder-folder", default="Flight recorder", help="where slow images are saved")
+    parser.add_argument("--recorder-max-records", type=int, default=20, help="slow images kept, the oldest are removed")
+    parser.add_argument("--recorder-profiler", choices=PROFILERS, default="sample",
+                        help="stack sampling (cheap) or cProfile (exact call counts, slows every image down)")
+    args = parser.parse_args()
+
+    # Options a mode doesn't support stop the run instead of being silently ignored
+    modes = [mode for mode in ("serve", "watch", "pipelined") if getattr(args, mode)]
+    if len(modes) > 1:
+        parser.error(f"--{modes[0]} and --{modes[1]} can't be combined")
+    mode = modes[0] if modes else None
+    batch_options = ["tile_size", "tile_overlap", "low_memory", "track_memory", "cache_dir", "cache_max_gb", "manifest",
+                     "manifest_mode", "metrics", "metrics_format", "latency_budget_ms", "recorder_folder",
+                     "recorder_max_records", "recorder_profiler", "postprocess_processes", "chunksize", "unordered"]
+    mode_options = {"serve": ["host", "port", "max_batch_size", "max_wait_ms"], "watch": ["poll_interval"],
+                    "pipelined": ["decode_workers", "postprocess_workers", "queue_size"]}
+    unsupported = {} if mode is None else dict.fromkeys(batch_options, f"is not supported with --{mode}")
+    if mode in ("serve", "watch"):
+        unsupported["batch_size"] = f"is not supported with --{mode}"
+    for other_mode, names in mode_options.items():
+        if other_mode != mode:
+            unsupported.update(dict.fromkeys(names, f"only applies with --{other_mode}"))
+    for name, reason in unsupported.items():
+        if getattr(args, name) != parser.get_default(name):
+            parser.error(f"--{name.replace('_', '-')} {reason}")
+
+    options = RunOptions(
+        max_snap_radius=args.max_snap_radius, min_region_area=args.min_region_area, batch_size=args.batch_size,
+        postprocess_processes=args.postprocess_processes, chunksize=args.chunksize, ordered=not args.unordered,
+        grayscale=args.grayscale, reduced_scale=args.reduced_scale, tile_size=args.tile_size,
+        tile_overlap=args.tile_overlap, low_memory=args.low_memory, track_memory=args.track_memory,
+        engine=args.engine, cache_dir=args.cache_dir, cache_max_bytes=int(args.cache_max_gb * 2 ** 30),
+        manifest_path=args.manifest, manifest_mode=args.manifest_mode, metrics_path=args.metrics,
+        metrics_format=args.metrics_format,
+        latency_budget=args.latency_budget_ms / 1000 if args.latency_budget_ms is not None else None,
+        recorder_folder=args.recorder_folder, recorder_max_records=args.recorder_max_records,
+        recorder_profiler=args.recorder_profiler)
 
-    # Determine the latest train folder
-    def extract_suffix(folder_name):
-        if folder_name == "train":
-            return 0
-        else:
-            return int(folder_name[5:])
-
-    latest_train_folder = max(train_folders, key=extract_suffix)
-    latest_train_path = os.path.join(pose_folder, latest_train_folder, 'weights', 'last.pt')
+    current_path = os.getcwd()
+    latest_train_path = latest_train_weights()
 
     images_folder = os.path.join(current_path, 'Images/')
     results_path = os.path.join(current_path, 'Results/')
 
-    process_all_images(images_folder, latest_train_path, results_path)
\ No newline at end of file
+    if args.serve:
+        serve(latest_train_path, options, args.host, args.port, args.max_batch_size, args.max_wait_ms / 1000)
+    elif args.watch:
+        watch_folder(images_folder, latest_train_path, results_path, options, args.poll_interval)
+    elif args.pipelined:
+        process_all_images_pipelined(images_folder, latest_train_path, results_path, options, args.decode_workers,
+                                     args.postprocess_workers, args.queue_size)
+    else:
+        process_all_images(images_folder, latest_train_path, results_path, options)
@@ -0,0 +1,43 @@
+import os
+import shutil
+import threading
+from contextlib import contextmanager, suppress
+
+# Files and folders written under a temporary name and renamed once complete, so that readers
+# (other processes, metric collectors, the comparator) never see them half written
+
+def temporary_name(path):
+    # Unique per process and thread, so concurrent writers of the same path don't clash
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    """
+    Opens a temporary file next to path for writing and moves it to path when the block ends.
+    If the block fails, path is left as it was and the temporary file is removed.
+    """
+    temporary_file = temporary_name(path)
+    try:
+        with open(temporary_file, mode) as file:
+            yield file
+        os.replace(temporary_file, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(temporary_file)
+        raise
+
+@contextmanager
+def atomic_folder(path):
+    """
+    Creates a hidden temporary folder next to path, yields it to be filled and renames it to
+    path when the block ends. Folders starting with '.' should be skipped by readers.
+    """
+    parent, name = os.path.split(path)
+    temporary_folder = os.path.join(parent, '.' + temporary_name(name))
+    os.makedirs(temporary_folder)
+    try:
+        yield temporary_folder
+        os.rename(temporary_folder, path)
+    except BaseException:
+        shutil.rmtree(temporary_folder, ignore_errors=True)
+        raise
@@ -0,0 +1,127 @@
+import os
+import zlib
+import queue
+import threading
+import cv2
+import numpy as np
+
+RED, BLUE, GREEN = (0, 0, 255), (255, 0, 0), (0, 255, 0)  # BGR
+
+class DebugArtifactWriter:
+    """
+    Renders and saves debug images on a background thread, so the pipeline only pays for
+    queueing the arrays it already has. Images are debugged when their file name is in images
+    or, for a sample_rate between 0 and 1, when the hash of their name falls under it (the same
+    images are picked on every run). The images of <image name> go to output_folder/<image name>/.
+    At most max_pending images wait for the thread; beyond that, artifacts are skipped instead
+    of blocking the caller, and the number skipped is printed by close.
+    """
+    def __init__(self, output_folder, images=None, sample_rate=0.0, max_pending=8):
+        self.output_folder = output_folder
+        self.images = set(images or ())
+        self.sample_rate = sample_rate
+        self.pending = queue.Queue(max_pending)
+        self.skipped = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def wants(self, image_file):
+        if image_file in self.images:
+            return True
+        return zlib.crc32(image_file.encode()) / 2 ** 32 < self.sample_rate
+
+    def submit(self, image_file, render, *args):
+        """
+        Queues render(*args), which returns {file name: image} and runs on the background
+        thread. The arrays in args must not be modified by the caller afterwards.
+        """
+        try:
+            self.pending.put_nowait((image_file, render, args))
+        except queue.Full:
+            self.skipped += 1
+
+    def _run(self):
+        while True:
+            task = self.pending.get()
+            if task is None:
+                break
+            image_file, render, args = task
+            try:
+                image_output_folder = os.path.join(self.output_folder, os.path.splitext(image_file)[0])
+                os.makedirs(image_output_folder, exist_ok=True)
+                for file_name, artifact in render(*args).items():
+                    cv2.imwrite(os.path.join(image_output_folder, file_name), artifact)
+            except Exception as error:
+                print(f"Failed to write the debug images of {image_file}: {type(error).__name__}: {error}")
+
+    def close(self):
+        # Waits for the queued images to be written
+        self.pending.put(None)
+        self.thread.join()
+        if self.skipped:
+            print(f"{self.skipped} debug artifacts skipped, the writer was busy")
+
+def annotate_detections(image, components):
+    # model_annotation.jpg: bounding boxes, labels and keypoints found by the model
+    annotated = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if image.ndim == 2 else image.copy()
+    for component in components:
+        x1, y1, x2, y2 = component["bounding_box"]
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), GREEN, 2)
+        cv2.putText(annotated, component["label"], (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, BLUE, 1)
+        for point in component["connection_points"]:
+            cv2.circle(annotated, (point[0], point[1]), 5, BLUE, -1)
+
+    return {'model_annotation.jpg': annotated}
+
+def region_mask(labeled_edges, regions, region_count):
+    # Pixels of the given regions, one lookup over the label image instead of one comparison per region
+    selected = np.zeros(region_count + 1, bool)
+    selected[list(regions)] = True
+    return selected[labeled_edges]
+
+def render_regions(connected_edges, labeled_edges, region_slices, region_to_node, region_top_left, ground_regions,
+                   connection_points):
+    """
+    The label and node debug images, drawn from the labels and their stats:
+    region_slices (scipy.ndimage.find_objects of the labels), region_to_node (label -> node id),
+    region_top_left (label -> (y, x)), the ground labels and the snapped connection points (x, y).
+    Returns after_labeling_regions.jpg (every region in red), numbered_nodes.jpg (one color
+    per node, ground in white, node ids at the region centers), top_left_most_pixel.jpg (the
+    pixel that orders the nodes) and connections.jpg (where the keypoints were snapped).
+    """
+    region_count = len(region_slices)
+    edges_image = cv2.cvtColor(connected_edges, cv2.COLOR_GRAY2BGR)
+
+    after_labeling_regions = edges_image.copy()
+    after_labeling_regions[labeled_edges > 0] = RED
+
+    # Node colors from a lookup table indexed by label
+    palette = cv2.applyColorMap(np.linspace(0, 255, 20).astype(np.uint8).reshape(-1, 1), cv2.COLORMAP_HSV)[:, 0]
+    colors = np.zeros((region_count + 1, 3), np.uint8)
+    for region, node_id in region_to_node.items():
+        colors[region] = (255, 255, 255) if region in ground_regions else palette[node_id % len(palette)]
+    numbered_nodes = colors[labeled_edges]
+    for region, node_id in region_to_node.items():
+        # Center of the region, searched in its bounding box only
+        region_slice = region_slices[region - 1]
+        ys, xs = np.nonzero(labeled_edges[region_slice] == region)
+        x, y = int(xs.mean()) + region_slice[1].start, int(ys.mean()) + region_slice[0].start
+        cv2.putText(numbered_nodes, str(node_id), (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 3, cv2.LINE_AA)  # Black outline
+        cv2.putText(numbered_nodes, str(node_id), (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+
+    node_image = edges_image
+    node_image[region_mask(labeled_edges, region_to_node, region_count)] = RED
+
+    top_left_most_pixel = node_image.copy()
+    for region, node_id in region_to_node.items():
+        y, x = region_top_left[region]
+        cv2.circle(top_left_most_pixel, (int(x), int(y)), 8, BLUE, -1)
+        cv2.putText(top_left_most_pixel, str(node_id), (int(x) - 5, int(y) + 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    (255, 255, 255), 1, cv2.LINE_AA)
+
+    connections = node_image
+    for x, y in connection_points:
+        cv2.circle(connections, (int(x), int(y)), 5, GREEN, -1)
+
+    return {'after_labeling_regions.jpg': after_labeling_regions, 'numbered_nodes.jpg': numbered_nodes,
+            'top_left_most_pixel.jpg': top_left_most_pixel, 'connections.jpg': connections}
@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+import numpy as np
+from atomic_files import atomic_write
+
+ARCHIVE_FORMATS = ("jsonl", "npz")
+
+class DetectionArchive:
+    """
+    Keeps the detections of a run on disk without slowing it down: detections are collected in
+    memory and every batch_size images are written as one file on a background thread, so an
+    image costs no file system access (on network storage, one write per image is slow).
+    Files are named detections_<run start>-<run id>_<batch number>.<format> in archive_folder:
+    "jsonl" has one {"image": ..., "detections": [...]} line per image, "npz" holds the same
+    detections as flat arrays (see write_npz). Read them back with load_archive.
+    At most max_pending batches wait for the thread, after that add waits for it.
+    """
+    def __init__(self, archive_folder, archive_format="jsonl", batch_size=64, max_pending=4):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format '{archive_format}', use one of {', '.join(ARCHIVE_FORMATS)}.")
+        os.makedirs(archive_folder, exist_ok=True)
+        self.archive_folder = archive_folder
+        self.archive_format = archive_format
+        self.batch_size = batch_size
+        # The random id keeps runs started in the same second, in any process, from overwriting each other
+        self.run_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.batch = []
+        self.batch_count = 0
+        self.pending = queue.Queue(max_pending)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, image_file, circuit_info):
+        # circuit_info must not be modified afterwards, it is written later
+        self.batch.append((image_file, circuit_info))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.batch_count += 1
+            path = os.path.join(self.archive_folder,
+                                f"detections_{self.run_name}_{self.batch_count:05d}.{self.archive_format}")
+            self.pending.put((path, self.batch))
+            self.batch = []
+
+    def _run(self):
+        while True:
+            task = self.pending.get()
+            if task is None:
+                break
+            path, batch = task
+            try:
+                # A reader never sees a partial batch
+                if self.archive_format == "jsonl":
+                    with atomic_write(path) as archive:
+                        write_jsonl(archive, batch)
+                else:
+                    with atomic_write(path, 'wb') as archive:
+                        write_npz(archive, batch)
+            except Exception as error:
+                print(f"Failed to archive {len(batch)} detections to {path}: {type(error).__name__}: {error}")
+
+    def close(self):
+        # Writes the last partial batch and waits for every batch to be on disk
+        self.flush()
+        self.pending.put(None)
+        self.thread.join()
+
+def write_jsonl(archive, batch):
+    for image_file, circuit_info in batch:
+        archive.write(json.dumps({"image": image_file, "detections": circuit_info}, separators=(',', ':')) + "\n")
+
+def write_npz(archive, batch):
+    """
+    Writes the flat arrays of a batch to an open binary file: images, the image index, label and box (x1, y1, x2, y2) of every
+    detection, its number of keypoints and all keypoints (x, y) one after the other.
+    """
+    detections = [(image_index, component) for image_index, (_, circuit_info) in enumerate(batch)
+                  for component in circuit_info]
+    keypoints = [point for _, component in detections for point in component["connection_points"]]
+    np.savez_compressed(
+        archive,
+        images=np.array([image_file for image_file, _ in batch], dtype=str),
+        detection_image=np.array([image_index for image_index, _ in detections], np.int32),
+        labels=np.array([component["label"] for _, component in detections], dtype=str),
+        boxes=np.array([component["bounding_box"] for _, component in detections], np.int32).reshape(-1, 4),
+        keypoint_counts=np.array([len(component["connection_points"]) for _, component in detections], np.int32),
+        keypoints=np.array(keypoints, np.int32).reshape(-1, 2))
+
+def load_archive(path):
+    # Detections of an archive file as {image file: circuit_info}
+    if path.endswith('.jsonl'):
+        with open(path) as archive:
+            entries = [json.loads(line) for line in archive if line.strip()]
+        return {entry["image"]: entry["detections"] for entry in entries}
+
+    archive = np.load(path)
+    detections = {str(image_file): [] for image_file in archive["images"]}
+    keypoint_starts = np.concatenate(([0], np.cumsum(archive["keypoint_counts"])))
+    for index, image_index in enumerate(archive["detection_image"]):
+        detections[str(archive["images"][image_index])].append({
+            "label": str(archive["labels"][index]),
+            "bounding_box": archive["boxes"][index].tolist(),
+            "connection_points": archive["keypoints"][keypoint_starts[index]:keypoint_starts[index + 1]].tolist(),
+        })
+    return detections
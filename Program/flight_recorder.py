@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import pstats
+import shutil
+import cProfile
+import argparse
+import threading
+from collections import Counter
+import cv2
+import numpy as np
+from atomic_files import atomic_folder
+
+PROFILERS = ("sample", "cprofile")
+
+class StackSampler:
+    """
+    Sampling profiler of the thread that enters it: a background thread reads its stack every
+    interval seconds. Cheap enough to run on every image, unlike cProfile which slows down the
+    Python parts of the pipeline. Time spent inside OpenCV or NumPy shows up under the Python
+    function that called it.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()  # Collapsed stack (outermost call first) -> number of samples
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def save(self, folder):
+        # One "stack count" line per stack, the collapsed format read by flame graph tools
+        with open(os.path.join(folder, 'stacks.txt'), 'w') as stacks:
+            for stack, count in self.samples.most_common():
+                stacks.write(f"{stack} {count}\n")
+
+def save_cprofile(profile, folder):
+    # Binary stats for pstats/snakeviz and the 30 most expensive functions as text
+    profile.dump_stats(os.path.join(folder, 'profile.prof'))
+    with open(os.path.join(folder, 'profile.txt'), 'w') as text:
+        pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(30)
+
+class FlightRecorder:
+    """
+    Keeps the state of the images whose post-processing took longer than latency_budget seconds,
+    to reproduce tail cases without profiling whole runs. Every image is profiled while it is
+    processed (a StackSampler, or cProfile with profiler="cprofile") and an image over budget
+    is saved in a folder of its own under records_folder:
+    record.json (timings and parameters), image.png (the grayscale image), detections.json,
+    edges.png (the masked edge map), region_stats.npy (the label stats, one row of x, y, width,
+    height and area per region) and stacks.txt or profile.prof/profile.txt.
+    At most max_records are kept, the oldest are removed first. Plain data, so it can be sent
+    to the post-processing workers, which write their records themselves.
+    """
+    def __init__(self, records_folder, latency_budget, max_records=20, profiler="sample"):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler '{profiler}', use one of {', '.join(PROFILERS)}.")
+        self.records_folder = records_folder
+        self.latency_budget = latency_budget
+        self.max_records = max_records
+        self.profiler = profiler
+
+    def run(self, compute_netlist, image, circuit_info, image_file, options):
+        """
+        Runs compute_netlist(image, circuit_info, **options) under the profiler and records the
+        image if it goes over budget. Returns the netlist.
+        """
+        intermediates = {}
+        profiler = StackSampler() if self.profiler == "sample" else cProfile.Profile()
+        start_time = time.perf_counter()
+        with profiler:
+            netlist = compute_netlist(image, circuit_info, intermediates=intermediates, **options)
+            elapsed = time.perf_counter() - start_time  # Without stopping the profiler
+
+        if elapsed > self.latency_budget:
+            record_folder = self.save(image_file, elapsed, image, circuit_info, intermediates, profiler, options)
+            print(f"{image_file} took {elapsed * 1000:.0f} ms (budget {self.latency_budget * 1000:.0f} ms), "
+                  f"saved to: {record_folder}")
+        return netlist
+
+    def save(self, image_file, elapsed, image, circuit_info, intermediates, profiler, options):
+        record_name = f"{time.time_ns()}_{os.getpid()}_{os.path.splitext(image_file)[0]}"
+        record_folder = os.path.join(self.records_folder, record_name)
+        os.makedirs(self.records_folder, exist_ok=True)
+        with atomic_folder(record_folder) as temporary_folder:  # A record is never seen half written
+            self.write_record(temporary_folder, image_file, elapsed, image, circuit_info, intermediates, profiler,
+                              options)
+        self.prune()
+        return record_folder
+
+    def write_record(self, folder, image_file, elapsed, image, circuit_info, intermediates, profiler, options):
+        trace = options.get("trace")
+        record = {"image": image_file, "elapsed_ms": round(elapsed * 1000, 3),
+                  "latency_budget_ms": round(self.latency_budget * 1000, 3), "time": time.time(), "pid": os.getpid(),
+                  "parameters": {name: options[name] for name in ("max_snap_radius", "min_region_area", "tile_size")
+                                 if name in options},
+                  "detections": len(circuit_info), "stages": trace.stages if trace is not None else None}
+        region_stats = intermediates.get("region_stats")
+        if region_stats is not None:
+            record["regions"] = int(region_stats.shape[0] - 1)  # Without the background
+        with open(os.path.join(folder, 'record.json'), 'w') as record_file:
+            json.dump(record, record_file, indent=4)
+
+        with open(os.path.join(folder, 'detections.json'), 'w') as detections:
+            json.dump(circuit_info, detections)
+        cv2.imwrite(os.path.join(folder, 'image.png'), image)
+        if "edges" in intermediates:
+            cv2.imwrite(os.path.join(folder, 'edges.png'), intermediates["edges"])
+        if region_stats is not None:
+            np.save(os.path.join(folder, 'region_stats.npy'), region_stats)
+        if isinstance(profiler, StackSampler):
+            profiler.save(folder)
+        else:
+            save_cprofile(profiler, folder)
+
+    def prune(self):
+        # Oldest records first, names start with the time they were taken
+        records = sorted(record_name for record_name in os.listdir(self.records_folder)
+                         if not record_name.startswith('.'))
+        for record_name in records[:max(0, len(records) - self.max_records)]:
+            shutil.rmtree(os.path.join(self.records_folder, record_name), ignore_errors=True)  # Another process may be pruning too
+
+def load_record(record_folder):
+    """
+    Loads a saved record to reproduce it, e.g.
+    compute_netlist(record["image"], record["detections"], **record["parameters"]).
+    """
+    with open(os.path.join(record_folder, 'record.json')) as record_file:
+        record = json.load(record_file)
+    with open(os.path.join(record_folder, 'detections.json')) as detections:
+        record["detections"] = json.load(detections)
+    record["image"] = cv2.imread(os.path.join(record_folder, 'image.png'), cv2.IMREAD_GRAYSCALE)
+    return record
+
+def main():
+    parser = argparse.ArgumentParser(description="List the images saved by the flight recorder, slowest first.")
+    parser.add_argument("records_folder", nargs="?", default="Flight recorder")
+    parser.add_argument("--top", type=int, default=3, help="hottest sampled stacks shown per record")
+    args = parser.parse_args()
+
+    records = []
+    for record_name in os.listdir(args.records_folder):
+        record_path = os.path.join(args.records_folder, record_name, 'record.json')
+        if not record_name.startswith('.') and os.path.exists(record_path):
+            with open(record_path) as record_file:
+                records.append((record_name, json.load(record_file)))
+
+    for record_name, record in sorted(records, key=lambda item: -item[1]["elapsed_ms"]):
+        print(f"{record['image']}: {record['elapsed_ms']:.0f} ms, {record['detections']} detections, "
+              f"{record.get('regions', '?')} regions ({record_name})")
+        stacks_path = os.path.join(args.records_folder, record_name, 'stacks.txt')
+        if os.path.exists(stacks_path):
+            with open(stacks_path) as stacks:
+                for line in stacks.readlines()[:args.top]:
+                    stack, count = line.rsplit(' ', 1)
+                    print(f"    {int(count):>5} samples in {stack.split(';')[-1]}")
+
+if __name__ == '__main__':
+    main()
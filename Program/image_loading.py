@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+
+# OpenCV decode flags for (grayscale, reduced_scale). The reduced flags let the JPEG
+# decoder skip the full resolution pass, which is much faster on large scans.
+DECODE_FLAGS = {
+    (False, 1): cv2.IMREAD_COLOR,
+    (False, 2): cv2.IMREAD_REDUCED_COLOR_2,
+    (False, 4): cv2.IMREAD_REDUCED_COLOR_4,
+    (False, 8): cv2.IMREAD_REDUCED_COLOR_8,
+    (True, 1): cv2.IMREAD_GRAYSCALE,
+    (True, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (True, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (True, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+def load_image(image_path, grayscale=False, reduced_scale=1):
+    """
+    Decodes an image once so the same array can be passed to the model and to detect_edges.
+    reduced_scale can be 1, 2, 4 or 8.
+    """
+    if (grayscale, reduced_scale) not in DECODE_FLAGS:
+        raise ValueError(f"Unsupported reduced_scale {reduced_scale}, use 1, 2, 4 or 8.")
+
+    image = cv2.imread(image_path, DECODE_FLAGS[(grayscale, reduced_scale)])
+    if image is None:
+        raise FileNotFoundError(f"Could not read image '{image_path}'.")
+
+    return image
+
+def to_model_input(image):
+    # The model expects a 3 channel BGR image
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if image.ndim == 2 else image
+
+def to_grayscale(image):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def decode_image(data, grayscale=False, reduced_scale=1):
+    # Decodes an encoded image (e.g. the body of an HTTP request) held in memory, like load_image
+    if (grayscale, reduced_scale) not in DECODE_FLAGS:
+        raise ValueError(f"Unsupported reduced_scale {reduced_scale}, use 1, 2, 4 or 8.")
+    if not data:
+        raise ValueError("Empty image data.")
+    try:
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), DECODE_FLAGS[(grayscale, reduced_scale)])
+    except cv2.error:
+        image = None  # OpenCV raises instead of returning None for some malformed data
+    if image is None:
+        raise ValueError("Could not decode image data.")
+
+    return image
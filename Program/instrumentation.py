@@ -0,0 +1,157 @@
+import sys
+import json
+import time
+from contextlib import contextmanager
+import numpy as np
+from atomic_files import atomic_write
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows, peak RSS is not reported
+
+METRICS_FORMATS = ("jsonl", "prometheus")
+PERCENTILES = (50, 90, 99)
+
+def max_rss_bytes():
+    # Largest resident set size of this process so far, None where it can't be read
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024  # Bytes on macOS, kilobytes elsewhere
+
+class ImageTrace:
+    """
+    Stage timings and counts of one image. Each stage records its wall and CPU time (of the
+    whole process, so threads started by OpenCV are included) in milliseconds and the peak RSS
+    of the process when it ended; a stage that raised the peak shows the new high-water mark.
+    Plain data, so a trace made in a worker process can be sent back with the netlist.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_stage(name, (time.perf_counter() - wall_start) * 1000, (time.process_time() - cpu_start) * 1000)
+
+    def add_stage(self, name, wall_ms, cpu_ms):
+        self.stages[name] = {"wall_ms": round(wall_ms, 3), "cpu_ms": round(cpu_ms, 3), "max_rss_bytes": max_rss_bytes()}
+
+    def count(self, name, value):
+        self.counts[name] = int(value)
+
+    def merge(self, other):
+        # Adds the stages and counts of a trace made elsewhere, e.g. the post-processing of a worker
+        self.stages.update(other.stages)
+        self.counts.update(other.counts)
+
+class Instrumentation:
+    """
+    Opt-in metrics of a process_all_images run. Every finished image is written to output_path
+    as a JSON line ("jsonl") as soon as it is done, or the run is summarized in a Prometheus
+    text file ("prometheus", e.g. for the node exporter textfile collector) when it is closed.
+    Stage percentiles are printed at the end of the run in both cases.
+    """
+    def __init__(self, output_path, output_format="jsonl"):
+        if output_format not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format '{output_format}', use one of {', '.join(METRICS_FORMATS)}.")
+        self.output_path = output_path
+        self.output_format = output_format
+        self.output = open(output_path, 'w') if output_format == "jsonl" else None
+        self.traces = {}  # Image file -> trace of an image still being processed
+        self.stage_samples = {}  # Stage -> ([wall ms], [cpu ms])
+        self.count_totals = {}
+        self.images = 0
+        self.cached_images = 0
+        self.max_rss = None
+
+    def trace(self, image_file):
+        # Trace of the stages run for the image in this process
+        return self.traces.setdefault(image_file, ImageTrace())
+
+    def discard(self, image_file):
+        # Drops the trace of an image that failed, it is not part of the metrics
+        self.traces.pop(image_file, None)
+
+    def finish(self, image_file, cached=False):
+        trace = self.traces.pop(image_file, None) or ImageTrace()
+
+        self.images += 1
+        self.cached_images += cached
+        for name, stage in trace.stages.items():
+            wall_samples, cpu_samples = self.stage_samples.setdefault(name, ([], []))
+            wall_samples.append(stage["wall_ms"])
+            cpu_samples.append(stage["cpu_ms"])
+            if stage["max_rss_bytes"] is not None:
+                self.max_rss = max(self.max_rss or 0, stage["max_rss_bytes"])
+        for name, value in trace.counts.items():
+            self.count_totals[name] = self.count_totals.get(name, 0) + value
+
+        if self.output:
+            self.output.write(json.dumps({"image": image_file, "cached": cached, "stages": trace.stages,
+                                          "counts": trace.counts}) + "\n")
+            self.output.flush()
+
+    def summary(self):
+        # Percentiles of the wall and CPU time of each stage over the finished images
+        summary = {}
+        for name, (wall_samples, cpu_samples) in self.stage_samples.items():
+            wall_percentiles = np.percentile(wall_samples, PERCENTILES)
+            summary[name] = {"images": len(wall_samples), "total_cpu_ms": round(sum(cpu_samples), 3),
+                             "max_ms": round(max(wall_samples), 3),
+                             **{f"p{percentile}_ms": round(float(value), 3)
+                                for percentile, value in zip(PERCENTILES, wall_percentiles)}}
+        return summary
+
+    def write_prometheus(self, summary):
+        lines = ["# HELP netlist_stage_seconds Wall time of a pipeline stage per image.",
+                 "# TYPE netlist_stage_seconds summary"]
+        for name, stage in summary.items():
+            wall_samples, _ = self.stage_samples[name]
+            for percentile in PERCENTILES:
+                lines.append(f'netlist_stage_seconds{{stage="{name}",quantile="{percentile / 100}"}} '
+                             f'{round(stage[f"p{percentile}_ms"] / 1000, 6)}')
+            lines.append(f'netlist_stage_seconds_sum{{stage="{name}"}} {round(sum(wall_samples) / 1000, 6)}')
+            lines.append(f'netlist_stage_seconds_count{{stage="{name}"}} {len(wall_samples)}')
+
+        lines += ["# HELP netlist_stage_cpu_seconds_total CPU time spent in a pipeline stage.",
+                  "# TYPE netlist_stage_cpu_seconds_total counter"]
+        lines += [f'netlist_stage_cpu_seconds_total{{stage="{name}"}} {round(stage["total_cpu_ms"] / 1000, 6)}'
+                  for name, stage in summary.items()]
+
+        lines += ["# HELP netlist_images_total Images finished, cached ones included.",
+                  "# TYPE netlist_images_total counter",
+                  f"netlist_images_total {self.images}",
+                  "# HELP netlist_cached_images_total Images served from the result cache.",
+                  "# TYPE netlist_cached_images_total counter",
+                  f"netlist_cached_images_total {self.cached_images}"]
+        for name, value in self.count_totals.items():
+            lines += [f"# TYPE netlist_{name}_total counter", f"netlist_{name}_total {value}"]
+        if self.max_rss is not None:
+            lines += ["# HELP netlist_max_rss_bytes Largest resident set size of a process of the run.",
+                      "# TYPE netlist_max_rss_bytes gauge",
+                      f"netlist_max_rss_bytes {self.max_rss}"]
+
+        with atomic_write(self.output_path) as metrics:  # A collector never reads a partial file
+            metrics.write("\n".join(lines) + "\n")
+
+    def close(self):
+        summary = self.summary()
+        if self.output:
+            self.output.close()
+        else:
+            self.write_prometheus(summary)
+
+        print(f"Stage timings over {self.images} images ({self.cached_images} from the cache):")
+        print(f"  {'Stage':<20} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10} {'CPU s':>10}")
+        for name, stage in summary.items():
+            print(f"  {name:<20} {stage['p50_ms']:>10.1f} {stage['p90_ms']:>10.1f} {stage['p99_ms']:>10.1f} "
+                  f"{stage['max_ms']:>10.1f} {stage['total_cpu_ms'] / 1000:>10.2f}")
+        if self.max_rss is not None:
+            print(f"  Peak RSS: {self.max_rss / 2 ** 20:.1f} MiB")
+        print(f"Metrics saved to: {self.output_path}")
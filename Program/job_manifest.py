@@ -0,0 +1,95 @@
+import time
+import hashlib
+import sqlite3
+import threading
+from netlist_generator import compute_netlist_task
+
+# Which images a run processes, given what the manifest recorded for them
+MANIFEST_MODES = {
+    "all": None,  # Every image, whatever its status
+    "resume": {None, "running"},  # Images never started or interrupted mid-run, failed images are left alone
+    "retry_failed": {"failed"},  # Only images that failed
+    "skip_completed": {None, "running", "failed"},  # Everything that isn't done
+}
+
+class JobManifest:
+    """
+    SQLite record of a process_all_images run: status ("running", "done" or "failed"), timing,
+    hash of the netlist written and the error of each image, so a crashed or partial run can be
+    restarted without redoing finished images. Safe to use from several threads of one process.
+    """
+    def __init__(self, manifest_path):
+        self.connection = sqlite3.connect(manifest_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")  # Cheap commits, one per image
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS images (
+                                       image_file TEXT PRIMARY KEY,
+                                       status TEXT NOT NULL,
+                                       started_at REAL,
+                                       finished_at REAL,
+                                       seconds REAL,
+                                       output_hash TEXT,
+                                       error TEXT,
+                                       attempts INTEGER NOT NULL DEFAULT 0)""")
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+    def select(self, image_files, mode="skip_completed"):
+        # Returns the image files the given mode processes, in their original order
+        if mode not in MANIFEST_MODES:
+            raise ValueError(f"Unknown manifest mode '{mode}', use one of {', '.join(MANIFEST_MODES)}.")
+        if MANIFEST_MODES[mode] is None:
+            return list(image_files)
+
+        with self.lock:
+            statuses = dict(self.connection.execute("SELECT image_file, status FROM images"))
+        return [image_file for image_file in image_files if statuses.get(image_file) in MANIFEST_MODES[mode]]
+
+    def _execute(self, statement, parameters):
+        with self.lock:
+            self.connection.execute(statement, parameters)
+            self.connection.commit()
+
+    def mark_started(self, image_file):
+        self._execute("""INSERT INTO images (image_file, status, started_at, attempts) VALUES (?, 'running', ?, 1)
+                         ON CONFLICT (image_file) DO UPDATE SET status = 'running', started_at = excluded.started_at,
+                         finished_at = NULL, seconds = NULL, error = NULL, attempts = attempts + 1""",
+                      (image_file, time.time()))
+
+    def mark_done(self, image_file, netlist):
+        output_hash = hashlib.sha256(netlist.to_text().encode()).hexdigest()
+        self._execute("""UPDATE images SET status = 'done', finished_at = ?1, seconds = ?1 - started_at,
+                         output_hash = ?2 WHERE image_file = ?3""", (time.time(), output_hash, image_file))
+
+    def mark_failed(self, image_file, error):
+        self._execute("""UPDATE images SET status = 'failed', finished_at = ?1, seconds = ?1 - started_at,
+                         error = ?2 WHERE image_file = ?3""", (time.time(), error, image_file))
+
+    def summary(self):
+        # Image count per status and throughput of the finished images
+        with self.lock:
+            counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM images GROUP BY status"))
+            done, first_start, last_finish, mean_seconds = self.connection.execute(
+                "SELECT COUNT(*), MIN(started_at), MAX(finished_at), AVG(seconds) FROM images WHERE status = 'done'"
+            ).fetchone()
+
+        summary = {"counts": counts}
+        if done:
+            summary["mean_seconds"] = round(mean_seconds, 3)
+            if last_finish > first_start:
+                summary["images_per_hour"] = round(done / (last_finish - first_start) * 3600, 1)
+        return summary
+
+    def close(self):
+        self.connection.close()
+
+def guarded_netlist_task(task):
+    """
+    compute_netlist_task for runs with a manifest: an error is returned instead of raised, so
+    one bad image is recorded as failed without stopping the run.
+    Returns (image_file, result of compute_netlist_task or None, error message or None).
+    """
+    image_file = task[2]
+    try:
+        return image_file, compute_netlist_task(task), None
+    except Exception as error:
+        return image_file, None, f"{type(error).__name__}: {error}"
@@ -0,0 +1,86 @@
+import os
+from model_registry import resolve_weights
+
+# Inference engines and the ultralytics export format of each, PyTorch runs the checkpoint directly
+ENGINE_FORMATS = {"pytorch": None, "onnx": "onnx", "openvino": "openvino"}
+
+# INT8 ONNX model written by "Model training/Quantize model.py" once it passed the accuracy check
+QUANTIZED_ENGINE = "onnx_int8"
+ENGINES = list(ENGINE_FORMATS) + [QUANTIZED_ENGINE]
+
+def exported_model_path(model_path, engine):
+    # Where ultralytics writes the export: last.onnx or the last_openvino_model folder next to last.pt
+    base_path = os.path.splitext(model_path)[0]
+    if engine == "onnx":
+        return base_path + ".onnx"
+    if engine == "openvino":
+        return base_path + "_openvino_model"
+    if engine == QUANTIZED_ENGINE:
+        return base_path + "_int8.onnx"
+    return model_path
+
+def model_key_path(model_path, engine):
+    """
+    File whose content identifies the model an engine runs, e.g. for cache keys. The ONNX and
+    OpenVINO exports are made from the checkpoint, so the checkpoint is used (together with the
+    engine name) and nothing has to be exported first. The INT8 model depends on its calibration,
+    so it is its own file.
+    """
+    if engine == QUANTIZED_ENGINE:
+        return export_model(model_path, engine)  # Raises if the model was never quantized
+    return model_path
+
+def export_model(model_path, engine, imgsz=640):
+    """
+    Converts the trained PyTorch checkpoint for the given engine and returns the exported path.
+    The export is reused as long as it is newer than the checkpoint. PyTorch needs no export,
+    the registered inference artifact is used when there is one (see model_registry).
+    The exported model takes dynamic batch and image sizes, like the checkpoint.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', use one of {', '.join(ENGINES)}.")
+
+    if engine == "pytorch":
+        return resolve_weights(model_path)
+
+    export_path = exported_model_path(model_path, engine)
+    if engine == QUANTIZED_ENGINE:
+        if not os.path.exists(export_path):
+            raise FileNotFoundError(f"No quantized model at '{export_path}', run 'Model training/Quantize model.py' first.")
+        return export_path
+    if os.path.exists(export_path) and os.path.getmtime(export_path) >= os.path.getmtime(model_path):
+        return export_path
+
+    from ultralytics import YOLO  # Imported on first use, it pulls in torch
+    return YOLO(model_path).export(format=ENGINE_FORMATS[engine], imgsz=imgsz, dynamic=True)
+
+def load_model(model_path, engine="pytorch"):
+    """
+    Loads the pose model for the given engine ("pytorch", "onnx", "openvino" or "onnx_int8"),
+    exporting it first if needed. Every engine returns the same ultralytics Results, so the
+    boxes and the 3 keypoints are decoded by the same code (netlist_generator.extract_circuit_info).
+    """
+    from ultralytics import YOLO
+    return YOLO(export_model(model_path, engine), task="pose")
+
+class LazyModel:
+    """
+    Stands in for load_model(model_path, engine) and only loads the model (and imports torch)
+    when it is first used, so runs that never need inference, e.g. when every image is served
+    from the result cache, start instantly.
+    """
+    def __init__(self, model_path, engine="pytorch"):
+        self.model_path = model_path
+        self.engine = engine
+        self.model = None
+
+    def load(self):
+        if self.model is None:
+            self.model = load_model(self.model_path, self.engine)
+        return self.model
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
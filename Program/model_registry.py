@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import hashlib
+from atomic_files import atomic_write
+
+# Project path is one level up from the Program folder
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POSE_FOLDER = os.path.join(PROJECT_PATH, 'Current trained model/pose')
+MANIFEST_PATH = os.path.join(PROJECT_PATH, 'Current trained model/model_manifest.json')
+
+def latest_train_weights(pose_folder=POSE_FOLDER):
+    # Weights of the most recent training run (the train folder with the highest number)
+    train_folders = [folder for folder in os.listdir(pose_folder) if folder.startswith('train')]
+
+    # Check if there are train folders
+    if not train_folders:
+        raise FileNotFoundError("No 'train' folders found in the pose directory.")
+
+    # Determine the latest train folder
+    def extract_suffix(folder_name):
+        if folder_name == "train":
+            return 0
+        else:
+            return int(folder_name[5:])
+
+    latest_train_folder = max(train_folders, key=extract_suffix)
+    return os.path.join(pose_folder, latest_train_folder, 'weights', 'last.pt')
+
+def hash_path(path):
+    # SHA-256 of a file, or of every file in a folder (e.g. an OpenVINO model folder),
+    # read in chunks so large checkpoints aren't loaded at once
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        file_paths = sorted(os.path.join(folder, file_name) for folder, _, file_names in os.walk(path)
+                            for file_name in file_names)
+    else:
+        file_paths = [path]
+
+    for file_path in file_paths:
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+def inference_artifact_path(weights_path):
+    return os.path.splitext(weights_path)[0] + '_inference.pt'
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """
+    Returns the registered models, keyed by the weights path relative to the manifest folder.
+    Each entry holds the weights hash, size and modification time, the class names, kpt_shape
+    and the inference artifact built from the weights.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as manifest:
+        return json.load(manifest)
+
+def register_model(weights_path=None, manifest_path=MANIFEST_PATH):
+    """
+    Adds the weights (by default the latest training run) to the manifest and saves an
+    inference-only artifact next to them: the model with its conv and batch norm layers fused
+    and without the optimizer state, so it unpickles faster and needs no fusing at load time.
+    Returns the manifest entry.
+    """
+    import torch  # Heavy imports are only needed when registering
+    from ultralytics import YOLO
+
+    weights_path = weights_path or latest_train_weights()
+    model = YOLO(weights_path)
+    model.fuse()
+
+    artifact_path = inference_artifact_path(weights_path)
+    with atomic_write(artifact_path, 'wb') as artifact:  # A crash never leaves a truncated artifact
+        torch.save({"model": model.model, "train_args": model.ckpt.get("train_args", {})}, artifact)
+
+    weights_hash = hash_path(weights_path)
+    weights_stat = os.stat(weights_path)
+    manifest_folder = os.path.dirname(manifest_path)
+    entry = {
+        "hash": weights_hash,
+        "size": weights_stat.st_size,
+        "mtime_ns": weights_stat.st_mtime_ns,
+        "names": {str(class_index): name for class_index, name in model.names.items()},
+        "kpt_shape": list(model.model.kpt_shape),
+        "artifact": os.path.relpath(artifact_path, manifest_folder),
+    }
+
+    models = load_manifest(manifest_path)
+    models[os.path.relpath(weights_path, manifest_folder)] = entry
+    with atomic_write(manifest_path) as manifest:  # Runs resolving weights never read it half written
+        json.dump(models, manifest, indent=4)
+
+    return entry
+
+def resolve_weights(weights_path, manifest_path=MANIFEST_PATH):
+    """
+    Returns the path to load for the given weights: the registered inference artifact if the
+    weights are unchanged since they were registered, otherwise the weights themselves.
+    Unchanged size and modification time are trusted; weights of the same size with another
+    modification time (e.g. copied or touched) are compared by hash.
+    """
+    manifest_folder = os.path.dirname(manifest_path)
+    entry = load_manifest(manifest_path).get(os.path.relpath(weights_path, manifest_folder))
+    if entry is None:
+        return weights_path
+
+    weights_stat = os.stat(weights_path)
+    artifact_path = os.path.join(manifest_folder, entry["artifact"])
+    if not os.path.exists(artifact_path) or weights_stat.st_size != entry["size"]:
+        return weights_path
+    if weights_stat.st_mtime_ns != entry["mtime_ns"] and hash_path(weights_path) != entry["hash"]:
+        return weights_path
+
+    return artifact_path
+
+if __name__ == '__main__':
+    # Register the given weights, or the latest training run
+    registered = register_model(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"Registered model with classes {list(registered['names'].values())}, inference artifact saved to "
+          f"{registered['artifact']}")
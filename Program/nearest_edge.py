@@ -0,0 +1,37 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+class NearestEdgeIndex:
+    """
+    Nearest-edge lookup built once per image from the masked edges.
+    Replaces the per-keypoint scan over every edge pixel with a KD-tree query.
+    """
+    def __init__(self, masked_edges, max_snap_radius=None):
+        edge_points = np.argwhere(masked_edges > 0)  # Get all edge points (y, x) in raster order
+        self.max_snap_radius = max_snap_radius
+        # The tree keeps its own copy of the points (tree.data), so the argwhere array is not kept
+        self.tree = cKDTree(edge_points) if edge_points.size > 0 else None
+
+    def nearest(self, px, py):
+        """
+        Returns the coordinates (y, x) of the nearest edge pixel to (px, py),
+        or None if there are no edges within the max snap radius (inclusive).
+        """
+        if self.tree is None:
+            return None  # No edges in the mask
+
+        # cKDTree excludes distance_upper_bound itself, step just past it so an edge exactly
+        # max_snap_radius away is still found
+        upper_bound = np.inf if self.max_snap_radius is None else np.nextafter(self.max_snap_radius, np.inf)
+        nearest_distance, nearest_index = self.tree.query((py, px), distance_upper_bound=upper_bound)
+        if np.isinf(nearest_distance):
+            return None  # Nearest edge is further than the max snap radius
+
+        # Several edge pixels can be at the same distance, keep the first one in raster order
+        # so the result matches the old brute force argmin over all edge points
+        if nearest_distance > 0:
+            candidates = np.array(self.tree.query_ball_point((py, px), nearest_distance + 1e-6))
+            squared_distances = ((self.tree.data[candidates] - (py, px)) ** 2).sum(axis=1)
+            nearest_index = candidates[np.flatnonzero(squared_distances == squared_distances.min())].min()
+
+        return self.tree.data[nearest_index].astype(np.intp)
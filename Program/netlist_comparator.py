@@ -0,0 +1,12 @@
+import os
+import importlib.util
+
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Project path is one level up
+COMPARATOR_PATH = os.path.join(PROJECT_PATH, 'Program test/Netlist generator algorithm test/Methods Results Comparator.py')
+
+def load_comparator():
+    # The comparator script has spaces in its name, so it is loaded from its path
+    spec = importlib.util.spec_from_file_location('methods_results_comparator', COMPARATOR_PATH)
+    comparator = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(comparator)
+    return comparator
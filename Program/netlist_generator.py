@@ -0,0 +1,431 @@
+import os
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import cv2
+import numpy as np
+from atomic_files import atomic_write
+from nearest_edge import NearestEdgeIndex
+from image_loading import load_image, to_model_input, to_grayscale
+
+# Columns of the keypoint to region table shared by the node numbering and writing phases
+CONNECTION_TABLE_DTYPE = [("component", np.int32), ("pin", np.int32), ("region", np.int32),
+                          ("x", np.int32), ("y", np.int32)]
+
+# Edge detection parameters, they are also part of the result cache key
+CANNY_THRESHOLDS = (50, 150)
+DILATION_KERNEL_SIZE = 5
+DILATION_ITERATIONS = 2
+
+# Snap radius used in tiled mode when none is given, it is also the halo labeled around each tile
+TILED_SNAP_RADIUS = 64
+
+class Pin:
+    def __init__(self, index, node, x, y):
+        self.index = index  # Keypoint index on the component
+        self.node = node
+        self.x = x  # Edge point the keypoint was snapped to
+        self.y = y
+
+    def __repr__(self):
+        return f"Pin({self.index} -> node {self.node} at ({self.x}, {self.y}))"
+
+class NetlistComponent:
+    def __init__(self, name, label, bounding_box, nodes, pins):
+        self.name = name  # Numbered name, e.g. Resistor_2
+        self.label = label  # Class name from the model, e.g. Resistor
+        self.bounding_box = bounding_box
+        self.nodes = nodes
+        self.pins = pins
+
+    def __repr__(self):
+        return f"{self.name} {self.nodes}"
+
+class Netlist:
+    def __init__(self, components):
+        self.components = components
+
+    def lines(self):
+        # One "<name> <node> <node> ..." line per component, the format of the Results folder
+        return [f"{component.name} {' '.join(map(str, component.nodes))}" for component in self.components]
+
+    def to_text(self):
+        return "".join(f"{line}\n" for line in self.lines())
+
+    def to_dict(self):
+        # Plain lists and dicts, so the netlist can be stored as JSON
+        return {"components": [{"name": component.name, "label": component.label,
+                                "bounding_box": component.bounding_box, "nodes": component.nodes,
+                                "pins": [[pin.index, pin.node, pin.x, pin.y] for pin in component.pins]}
+                               for component in self.components]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([NetlistComponent(component["name"], component["label"], component["bounding_box"],
+                                     component["nodes"], [Pin(*pin) for pin in component["pins"]])
+                    for component in data["components"]])
+
+    def __repr__(self):
+        return f"Netlist({self.components})"
+
+class Workspace:
+    """
+    Low-memory mode for compute_netlist. The grayscale, edge and label images are written into
+    buffers that are kept and reused for the next image of the same size, the components are
+    masked in place and labels are 16 bit whenever the region count fits.
+    A workspace must not be shared between threads.
+    """
+    def __init__(self):
+        self.buffers = {}
+
+    def buffer(self, name, shape, dtype):
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            self.buffers[name] = None  # Release the old buffer before allocating the new one
+            buffer = self.buffers[name] = np.empty(shape, dtype)
+        return buffer
+
+class MemoryTracker:
+    """
+    peak_bytes holds the largest peak of bytes allocated during each stage of compute_netlist,
+    measured with tracemalloc. Only Python and NumPy allocations are seen, which includes the
+    arrays returned by OpenCV but not its internal scratch memory, and buffers reused from an
+    earlier image by a Workspace are not counted. Tracing slows the Python parts down, so it
+    is only started by the first measured stage.
+    """
+    def __init__(self):
+        self.peak_bytes = {}
+
+    @contextmanager
+    def stage(self, name):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak_bytes - start_bytes)
+
+# Define helper functions
+def detect_edges(image, workspace=None):
+    if workspace is None:
+        grayscale = to_grayscale(image)  # Image is decoded once by load_image and shared with the model
+        edges = cv2.Canny(grayscale, *CANNY_THRESHOLDS)
+        kernel = np.ones((DILATION_KERNEL_SIZE, DILATION_KERNEL_SIZE), np.uint8)
+        connected_edges = cv2.dilate(edges, kernel, iterations=DILATION_ITERATIONS)
+
+        return connected_edges
+
+    shape = image.shape[:2]
+    grayscale = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY,
+                                                           dst=workspace.buffer("grayscale", shape, np.uint8))
+    edges = cv2.Canny(grayscale, *CANNY_THRESHOLDS, edges=workspace.buffer("edges", shape, np.uint8))
+    kernel = np.ones((DILATION_KERNEL_SIZE, DILATION_KERNEL_SIZE), np.uint8)
+    return cv2.dilate(edges, kernel, dst=edges, iterations=DILATION_ITERATIONS)  # Dilated in place
+
+def mask_components(connected_edges, components, in_place=False):
+    masked_edges = connected_edges if in_place else connected_edges.copy()
+    for component in components:
+        bbox = component["bounding_box"]
+        x1, y1, x2, y2 = bbox
+        cv2.rectangle(masked_edges, (x1, y1), (x2, y2), 0, -1)
+
+    return masked_edges
+
+def label_regions(masked_edges, min_region_area=0, workspace=None):
+    """
+    Labels the connected edge regions and collects their bounding box and area in one pass.
+    Regions smaller than min_region_area are treated as noise and erased from the masked
+    edges, so keypoints are never snapped onto them.
+    With a workspace the labels go into a reused buffer, 16 bit unless there are too many regions.
+    """
+    # 4-connectivity, same as the default structure of scipy.ndimage.label
+    if workspace is None:
+        _, labeled_edges, region_stats, _ = cv2.connectedComponentsWithStats(masked_edges, connectivity=4,
+                                                                             ltype=cv2.CV_32S)
+    else:
+        try:
+            _, labeled_edges, region_stats, _ = cv2.connectedComponentsWithStats(
+                masked_edges, labels=workspace.buffer("labels", masked_edges.shape, np.uint16), connectivity=4,
+                ltype=cv2.CV_16U)
+        except cv2.error:
+            # OpenCV stops when the region count overflows 16 bit labels
+            _, labeled_edges, region_stats, _ = cv2.connectedComponentsWithStats(
+                masked_edges, labels=workspace.buffer("labels", masked_edges.shape, np.int32), connectivity=4,
+                ltype=cv2.CV_32S)
+
+    if min_region_area > 0:
+        noise_regions = region_stats[:, cv2.CC_STAT_AREA] < min_region_area
+        noise_regions[0] = False  # Background
+        if noise_regions.any():
+            noise_mask = noise_regions[labeled_edges]
+            masked_edges[noise_mask] = 0
+            labeled_edges[noise_mask] = 0
+
+    return labeled_edges, region_stats
+
+def find_region_top_left(labeled_edges, region_stats, regions):
+    """
+    Finds the top-left-most pixel (first pixel in raster order) of each given region.
+    Only the top row of the region's bounding box is scanned.
+    """
+    region_top_left = {}
+    for region in regions:
+        x = region_stats[region, cv2.CC_STAT_LEFT]
+        y = region_stats[region, cv2.CC_STAT_TOP]
+        top_row = labeled_edges[y, x:x + region_stats[region, cv2.CC_STAT_WIDTH]]
+        region_top_left[region] = (y, x + np.argmax(top_row == region))  # (y, x)
+
+    return region_top_left
+
+def is_point_connected_or_nearest(nearest_edge_index, px, py):
+
+    # Find the nearest edge
+    nearest_edge = nearest_edge_index.nearest(px, py)
+    if nearest_edge is not None:
+        return True, (nearest_edge[1], nearest_edge[0])  # Return x, y of the nearest edge
+
+    print(f"No connection found for point ({px}, {py})")  # Debug message if something went wrong
+    return False, None  # No connection and no nearest edge
+
+def resolve_connection_points(labeled_edges, nearest_edge_index, components):
+    """
+    Resolves every component keypoint to a labeled edge region exactly once.
+    Returns a table with one row per connected keypoint: component index, pin index,
+    region id and the snapped (x, y) edge point used for the lookup.
+    """
+    rows = []
+    for component_index, component in enumerate(components):
+        for pin_index, point in enumerate(component["connection_points"]):
+            px, py = point
+            if py >= labeled_edges.shape[0] or px >= labeled_edges.shape[1]:
+                continue
+
+            is_connected, connection_point = is_point_connected_or_nearest(nearest_edge_index, px, py)
+            if is_connected:
+                connected_px, connected_py = connection_point
+                region = labeled_edges[connected_py, connected_px]  # Use the connected or nearest edge point
+                if region > 0:
+                    rows.append((component_index, pin_index, region, connected_px, connected_py))
+
+    return np.array(rows, dtype=CONNECTION_TABLE_DTYPE)
+
+def overlay_and_find_nodes_with_connected_regions(labeled_edges, region_stats, nearest_edge_index, components):
+    connection_table = resolve_connection_points(labeled_edges, nearest_edge_index, components)
+
+    # Regions hosting at least one keypoint become nodes, numbered by their top-left-most pixel
+    hosting_regions = dict.fromkeys(connection_table["region"].tolist())
+    region_top_left = find_region_top_left(labeled_edges, region_stats, hosting_regions)
+
+    return build_netlist(connection_table, region_top_left, components)
+
+def build_netlist(connection_table, region_top_left, components):
+    """
+    Numbers the nodes and builds the Netlist from the keypoint to region table.
+    region_top_left maps every region in the table to its top-left-most pixel (y, x).
+    """
+    # Sort regions by top-left-most pixel
+    sorted_regions = sorted(region_top_left.items(), key=lambda x: (x[1][0], x[1][1]))  # Sort by (y, x)
+
+    # Assign node IDs
+    new_region_to_node = {}
+    new_node_id = 1
+    for region, _ in sorted_regions:
+        new_region_to_node[region] = new_node_id
+        new_node_id += 1
+
+    # Build the netlist
+    netlist_components = []
+
+    # Dictionary to keep track of label counts
+    label_counts = {}
+
+    # Group the resolved regions by component, keeping the pin order
+    component_rows = defaultdict(list)
+    for component_index, pin_index, region, x, y in connection_table.tolist():
+        component_rows[component_index].append((pin_index, region, x, y))
+
+    for component_index, component in enumerate(components):
+        # Skip GND components
+        if component["label"].upper() == "GND":
+            continue
+
+        connected_nodes = [new_region_to_node[region] for _, region, _, _ in component_rows[component_index]
+                           if region in new_region_to_node]
+
+        # Ensure we only write components that have at least one connected node
+        connected_nodes = list(set(connected_nodes))
+        if connected_nodes:  # Check if there are any connected nodes
+            unique_label = component["label"]
+
+            # Increment the count for the current label
+            if unique_label not in label_counts:
+                label_counts[unique_label] = 0
+            label_counts[unique_label] += 1
+
+            # Create a new label with numbering
+            numbered_label = f"{unique_label}_{label_counts[unique_label]}"
+
+            pins = [Pin(pin_index, new_region_to_node[region], x, y)
+                    for pin_index, region, x, y in component_rows[component_index] if region in new_region_to_node]
+            netlist_components.append(NetlistComponent(numbered_label, unique_label, component["bounding_box"],
+                                                       connected_nodes, pins))
+
+    return Netlist(netlist_components)
+
+def extract_circuit_info(results):
+    circuit_info = []
+
+    for result in results:
+        for cls, keypoints, bbox in zip(result.boxes.cls.cpu().numpy(),
+                                         result.keypoints.xy.cpu().numpy(),
+                                         result.boxes.xyxy.cpu().numpy()):
+            class_idx = int(cls)
+            object_name = results.names[class_idx]
+
+            x_min, y_min, x_max, y_max = map(int, bbox)
+            bounding_box = [x_min, y_min, x_max, y_max]
+
+            connection_points = [
+                [int(point[0]), int(point[1])] for point in keypoints if not (point[0] == 0 and point[1] == 0)
+            ]
+
+            circuit_info.append({
+                "label": object_name,
+                "bounding_box": bounding_box,
+                "connection_points": connection_points
+            })
+
+    return circuit_info
+
+def measured_stages(memory_tracker=None, trace=None):
+    """
+    Returns the context manager factory wrapping each stage of compute_netlist: the peak memory
+    is measured with a MemoryTracker and the time with an instrumentation.ImageTrace.
+    Without either the stages are not measured at all.
+    """
+    measures = [measure.stage for measure in (memory_tracker, trace) if measure is not None]
+    if not measures:
+        return lambda name: nullcontext()
+    if len(measures) == 1:
+        return measures[0]
+
+    @contextmanager
+    def both(name):
+        with measures[0](name), measures[1](name):
+            yield
+    return both
+
+def compute_netlist(image, circuit_info, max_snap_radius=None, min_region_area=0, tile_size=None, workspace=None,
+                    trace=None, intermediates=None, memory_tracker=None):
+    """
+    Generates the netlist of a decoded image from its detections.
+    With a workspace the steps run on reused buffers (low-memory mode), with a memory_tracker
+    the peak allocation of each stage is recorded, with a trace (instrumentation.ImageTrace)
+    each stage is timed and the edge pixels, regions, keypoints and nodes are counted.
+    An intermediates dict receives the masked edges ("edges") and the label stats
+    ("region_stats") of the image, e.g. for the flight recorder.
+    """
+    stage = measured_stages(memory_tracker, trace)
+    if tile_size:
+        # Large sheets are labeled one tile at a time (see tiling.compute_netlist_tiled)
+        from tiling import compute_netlist_tiled
+        with stage("tiles"):
+            return compute_netlist_tiled(image, circuit_info, tile_size, max_snap_radius or TILED_SNAP_RADIUS,
+                                         min_region_area)
+
+    with stage("edges"):
+        connected_edges = detect_edges(image, workspace)
+    with stage("mask"):
+        masked_edges = mask_components(connected_edges, circuit_info, in_place=workspace is not None)
+    with stage("label"):
+        labeled_edges, region_stats = label_regions(masked_edges, min_region_area, workspace)
+    if intermediates is not None:
+        intermediates.update(edges=masked_edges, region_stats=region_stats)
+    with stage("nearest_edge_index"):
+        nearest_edge_index = NearestEdgeIndex(masked_edges, max_snap_radius)  # Built once per image
+    with stage("nodes"):
+        netlist = overlay_and_find_nodes_with_connected_regions(labeled_edges, region_stats, nearest_edge_index,
+                                                                circuit_info)
+
+    if trace is not None:
+        trace.count("detections", len(circuit_info))
+        trace.count("keypoints", sum(len(component["connection_points"]) for component in circuit_info))
+        trace.count("edge_pixels", np.count_nonzero(masked_edges))
+        trace.count("regions", region_stats.shape[0] - 1)  # Without the background
+        trace.count("nodes", len({node for component in netlist.components for node in component.nodes}))
+    return netlist
+
+_task_workspace = None  # Workspace of this worker process in low-memory mode
+_task_memory_tracker = None  # MemoryTracker of this worker process when tracking memory
+
+def compute_netlist_task(task):
+    """
+    Entry point for the post-processing worker processes, must stay a top-level function to be picklable.
+    options holds the keyword arguments of compute_netlist, plus low_memory to use a workspace
+    kept by the process, track_memory to measure the peak allocation of each stage, trace to
+    time the stages and flight_recorder (a flight_recorder.FlightRecorder) to save the images
+    over its latency budget.
+    Returns (image_file, netlist, peak bytes per stage of the process so far or None, ImageTrace or None).
+    """
+    global _task_workspace, _task_memory_tracker
+    image, circuit_info, image_file, options = task
+    options = dict(options)
+    recorder = options.pop("flight_recorder", None)
+    if options.pop("trace", False):
+        from instrumentation import ImageTrace  # Only imported by instrumented runs
+        options["trace"] = ImageTrace()
+    if options.pop("low_memory", False):
+        if _task_workspace is None:
+            _task_workspace = Workspace()
+        options["workspace"] = _task_workspace
+    if options.pop("track_memory", False):
+        if _task_memory_tracker is None:
+            _task_memory_tracker = MemoryTracker()
+        options["memory_tracker"] = _task_memory_tracker
+
+    if recorder is None:
+        netlist = compute_netlist(image, circuit_info, **options)
+    else:
+        netlist = recorder.run(compute_netlist, image, circuit_info, image_file, options)
+    peak_bytes = dict(_task_memory_tracker.peak_bytes) if "memory_tracker" in options else None
+    return image_file, netlist, peak_bytes, options.get("trace")
+
+class TextFileSink:
+    """
+    Writes each netlist to <results_path>/<image name>.txt.
+    Any object with a write(image_file, netlist) method can be used as a sink instead.
+    """
+    def __init__(self, results_path):
+        self.results_path = results_path
+        os.makedirs(results_path, exist_ok=True)
+
+    def write(self, image_file, netlist):
+        # Create a new text file for node positions
+        results_file = os.path.join(self.results_path, os.path.splitext(image_file)[0] + '.txt')
+
+        with atomic_write(results_file) as results:  # Readers never see a partial netlist
+            results.write(netlist.to_text())
+
+class MemorySink:
+    # Keeps the netlists in a dictionary keyed by image file name
+    def __init__(self):
+        self.netlists = {}
+
+    def write(self, image_file, netlist):
+        self.netlists[image_file] = netlist
+
+def generate_netlist(image, model, max_snap_radius=None, min_region_area=0, workspace=None):
+    """
+    Generates the netlist of one schematic without touching the disk.
+    image is a file path or an already decoded array, model a loaded YOLO pose model.
+    Pass the same Workspace for every call to reuse its buffers (low-memory mode).
+    Returns a Netlist.
+    """
+    if isinstance(image, (str, os.PathLike)):
+        image = load_image(image)
+
+    circuit_info = extract_circuit_info(model(to_model_input(image), verbose=False)[0])
+    return compute_netlist(image, circuit_info, max_snap_radius, min_region_area, workspace=workspace)
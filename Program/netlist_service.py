@@ -0,0 +1,181 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from image_loading import decode_image
+
+class InvalidImage(ValueError):
+    # The request body could not be decoded as an image, the client's fault unlike any later error
+    pass
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and passes them to batch_function together.
+    A batch starts as soon as max_batch_size items are waiting, or max_wait seconds after
+    the first item of the batch arrived.
+    """
+    def __init__(self, batch_function, max_batch_size=8, max_wait=0.01):
+        self.batch_function = batch_function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, name="micro-batcher", daemon=True).start()
+
+    def submit(self, item):
+        # Returns a Future holding the output of batch_function for this item
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                outputs = list(self.batch_function([item for item, _ in batch]))
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
+            # Items left without an output would otherwise wait forever
+            for _, future in batch[len(outputs):]:
+                future.set_exception(RuntimeError(f"batch_function returned {len(outputs)} outputs "
+                                                  f"for {len(batch)} items"))
+
+class LatencyTracker:
+    # Keeps the most recent latencies to report percentiles
+    def __init__(self, window=1000):
+        self.latencies = deque(maxlen=window)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.count += 1
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            count = self.count
+        if latencies.size == 0:
+            return {"count": count}
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        return {"count": count, "p50_ms": round(p50, 2), "p90_ms": round(p90, 2), "p99_ms": round(p99, 2),
+                "max_ms": round(latencies.max(), 2)}
+
+class NetlistService:
+    """
+    Turns encoded images into netlists. Inference for requests arriving close together is
+    coalesced into one detect_batch call, then each request runs compute_netlist on its own
+    handler thread.
+    detect_batch(images) returns the circuit_info of each image,
+    compute_netlist(image, circuit_info) returns the Netlist.
+    Images are decoded as with image_loading.load_image(grayscale, reduced_scale).
+    """
+    def __init__(self, detect_batch, compute_netlist, max_batch_size=8, max_wait=0.01, grayscale=False,
+                 reduced_scale=1):
+        self.batcher = MicroBatcher(detect_batch, max_batch_size, max_wait)
+        self.compute_netlist = compute_netlist
+        self.grayscale = grayscale
+        self.reduced_scale = reduced_scale
+        self.latency = LatencyTracker()
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def decode(self, image_data):
+        try:
+            return decode_image(image_data, self.grayscale, self.reduced_scale)
+        except ValueError as error:
+            raise InvalidImage(str(error)) from error
+
+    def generate(self, image_data):
+        start_time = time.perf_counter()
+        try:
+            image = self.decode(image_data)
+            circuit_info = self.batcher.submit(image).result()
+            netlist = self.compute_netlist(image, circuit_info)
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            raise
+        self.latency.record(time.perf_counter() - start_time)
+        return netlist
+
+    def stats(self):
+        return {"queue_depth": self.batcher.queue_depth, "errors": self.errors, "latency": self.latency.summary()}
+
+def make_server(service, host="127.0.0.1", port=8000):
+    """
+    Creates the HTTP server:
+      POST /netlist  body is the encoded image (jpg/png), returns the netlist as text
+      GET  /stats    returns queue depth and latency percentiles as JSON
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/netlist":
+                self.send_error(404)
+                return
+
+            if "Content-Length" not in self.headers:
+                self.send_error(411)
+                return
+            try:
+                content_length = int(self.headers["Content-Length"])
+            except ValueError:
+                content_length = -1
+            if content_length < 0:
+                # A negative length would make rfile.read wait for the client to close the connection
+                self.send_error(400, f"Invalid Content-Length '{self.headers['Content-Length']}'")
+                return
+
+            image_data = self.rfile.read(content_length)
+            try:
+                netlist = service.generate(image_data)
+            except InvalidImage as error:
+                self.send_error(400, str(error))
+                return
+            except Exception as error:
+                self.send_error(500, str(error))
+                return
+
+            self._send(200, "text/plain", netlist.to_text())
+
+        def do_GET(self):
+            if self.path != "/stats":
+                self.send_error(404)
+                return
+            self._send(200, "application/json", json.dumps(service.stats()))
+
+        def _send(self, status, content_type, body):
+            body = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Per request logging is replaced by /stats
+
+    return ThreadingHTTPServer((host, port), Handler)
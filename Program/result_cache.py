@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from atomic_files import atomic_write
+from model_registry import hash_path
+from netlist_generator import Netlist, CANNY_THRESHOLDS, DILATION_KERNEL_SIZE, DILATION_ITERATIONS
+
+CACHE_VERSION = 1  # Increase when the stored data or the pipeline changes in a way the parameters don't show
+
+# Hard coded post-processing parameters, part of every netlist key
+EDGE_PARAMETERS = {"canny_thresholds": CANNY_THRESHOLDS, "dilation_kernel_size": DILATION_KERNEL_SIZE,
+                   "dilation_iterations": DILATION_ITERATIONS}
+
+def cache_key(*parts):
+    # Key of a cache entry, parts must be JSON serializable
+    return hashlib.sha256(json.dumps([CACHE_VERSION, *parts], sort_keys=True).encode()).hexdigest()
+
+class ResultCache:
+    """
+    Content addressed store of JSON values on disk, one file per key.
+    Reading an entry marks it as recently used (its modification time is updated) and when the
+    cache grows beyond max_bytes the least recently used entries are removed.
+    Safe to use from several threads of one process.
+    """
+    def __init__(self, cache_dir, max_bytes=2 * 2 ** 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.entries = {}  # Path -> (last used time, size)
+        for folder, _, file_names in os.walk(cache_dir):
+            for file_name in file_names:
+                if file_name.endswith('.json'):
+                    path = os.path.join(folder, file_name)
+                    entry_stat = os.stat(path)
+                    self.entries[path] = (entry_stat.st_mtime, entry_stat.st_size)
+        self.total_bytes = sum(size for _, size in self.entries.values())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, key):
+        # Returns the stored value, or None on a miss
+        path = self._path(key)
+        try:
+            with open(path) as entry:
+                value = json.load(entry)
+            now = time.time()
+            os.utime(path, (now, now))
+        except (OSError, ValueError):
+            return None  # Missing, evicted meanwhile or unreadable
+
+        with self.lock:
+            if path in self.entries:
+                self.entries[path] = (now, self.entries[path][1])
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with atomic_write(path) as entry:  # Readers never see a partial entry
+            json.dump(value, entry)
+        size = os.path.getsize(path)
+
+        with self.lock:
+            _, old_size = self.entries.get(path, (0, 0))
+            self.entries[path] = (time.time(), size)
+            self.total_bytes += size - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop the least recently used entries down to 90% of max_bytes, so eviction doesn't run on every put
+        for path, (_, size) in sorted(self.entries.items(), key=lambda entry: entry[1][0]):
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            del self.entries[path]
+            self.total_bytes -= size
+
+class NetlistCache:
+    """
+    Detections and netlists of process_all_images keyed on the image content, the model file
+    and the parameters that affect them, so unchanged images are not processed again.
+    detection_parameters and netlist_parameters are dicts of the options in effect.
+    """
+    def __init__(self, cache_dir, model_file, detection_parameters, netlist_parameters, max_bytes=2 * 2 ** 30):
+        self.store = ResultCache(cache_dir, max_bytes)
+        self.model_hash = hash_path(model_file)
+        self.detection_parameters = detection_parameters
+        self.netlist_parameters = dict(netlist_parameters, **EDGE_PARAMETERS)
+        self.keys = {}  # Image path -> (detection key, netlist key)
+        self.lock = threading.Lock()
+
+    def _keys(self, image_path):
+        with self.lock:
+            keys = self.keys.get(image_path)
+        if keys is None:
+            detection_key = cache_key("detections", hash_path(image_path), self.model_hash, self.detection_parameters)
+            keys = (detection_key, cache_key("netlist", detection_key, self.netlist_parameters))
+            with self.lock:
+                self.keys[image_path] = keys
+        return keys
+
+    def get_detections(self, image_path):
+        return self.store.get(self._keys(image_path)[0])
+
+    def put_detections(self, image_path, circuit_info):
+        self.store.put(self._keys(image_path)[0], circuit_info)
+
+    def get_netlist(self, image_path):
+        data = self.store.get(self._keys(image_path)[1])
+        return None if data is None else Netlist.from_dict(data)
+
+    def put_netlist(self, image_path, netlist):
+        self.store.put(self._keys(image_path)[1], netlist.to_dict())
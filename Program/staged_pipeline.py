@@ -0,0 +1,110 @@
+import queue
+import threading
+
+_STOP = object()  # Sentinel telling a worker that its input is exhausted
+
+class Stage:
+    def __init__(self, name, function, workers=1, batch_size=None):
+        """
+        A pipeline stage. function takes one item and returns the item for the next stage,
+        or, when batch_size is set, takes a list of up to batch_size items and returns a list.
+        """
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.batch_size = batch_size
+
+class StagedPipeline:
+    """
+    Runs items through a chain of stages, each with its own worker threads, connected by
+    bounded queues so the stages overlap across items. A full queue blocks the stage feeding
+    it, which caps how many items are in flight at once.
+    """
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items):
+        """
+        Feeds items into the first stage and yields the outputs of the last stage as they
+        finish (not necessarily in input order). The first error raised by a stage is
+        re-raised once the pipeline has drained.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        errors = []
+        threads = []
+
+        for index, stage in enumerate(self.stages):
+            next_workers = self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+            remaining_workers = [stage.workers]
+            lock = threading.Lock()
+            for worker_index in range(stage.workers):
+                thread = threading.Thread(target=self._work,
+                                          args=(stage, queues[index], queues[index + 1], next_workers,
+                                                remaining_workers, lock, errors),
+                                          name=f"{stage.name}-{worker_index}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        feeder = threading.Thread(target=self._feed, args=(items, queues[0], self.stages[0].workers, errors),
+                                  name="feeder", daemon=True)
+        feeder.start()
+        threads.append(feeder)
+
+        while True:
+            output = queues[-1].get()
+            if output is _STOP:
+                break
+            yield output
+
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    @staticmethod
+    def _feed(items, input_queue, workers, errors):
+        try:
+            for item in items:
+                input_queue.put(item)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            for _ in range(workers):
+                input_queue.put(_STOP)
+
+    @staticmethod
+    def _work(stage, input_queue, output_queue, next_workers, remaining_workers, lock, errors):
+        stopped = False
+        while not stopped:
+            item = input_queue.get()
+            if item is _STOP:
+                break
+
+            # Collect whatever else is already waiting, up to the batch size
+            batch = [item]
+            while len(batch) < (stage.batch_size or 1):
+                try:
+                    item = input_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopped = True
+                    break
+                batch.append(item)
+
+            try:
+                outputs = stage.function(batch) if stage.batch_size else [stage.function(batch[0])]
+            except Exception as error:
+                errors.append(error)  # Drop the failed items and keep draining the queue
+                continue
+
+            for output in outputs:
+                output_queue.put(output)
+
+        # The last worker of a stage to finish tells every worker of the next stage to stop
+        with lock:
+            remaining_workers[0] -= 1
+            if remaining_workers[0] == 0:
+                for _ in range(next_workers):
+                    output_queue.put(_STOP)
@@ -0,0 +1,285 @@
+import cv2
+import numpy as np
+from nearest_edge import NearestEdgeIndex
+from image_loading import to_model_input, to_grayscale
+from netlist_generator import (CONNECTION_TABLE_DTYPE, TILED_SNAP_RADIUS, detect_edges, mask_components,
+                               find_region_top_left, is_point_connected_or_nearest, build_netlist)
+
+# Extra pixels read around each window to hide the border effects of the Canny gradient and the dilation.
+# Canny's hysteresis is not local, so a weak edge chain reaching beyond the margin can still differ from the full image
+EDGE_MARGIN = 8
+
+def tile_starts(length, tile_size, step):
+    # Start offsets of tiles covering [0, length), the last tile is aligned to the end
+    starts = list(range(0, max(length - tile_size, 0) + 1, step))
+    if starts[-1] + tile_size < length:
+        starts.append(length - tile_size)
+
+    return starts
+
+def overlap_ratio(box_a, box_b):
+    # Intersection over the smaller box, so a box cut by a tile border still matches the full box
+    width = min(box_a[2], box_b[2]) - max(box_a[0], box_b[0])
+    height = min(box_a[3], box_b[3]) - max(box_a[1], box_b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller_area = min((box_a[2] - box_a[0]) * (box_a[3] - box_a[1]), (box_b[2] - box_b[0]) * (box_b[3] - box_b[1]))
+    return width * height / max(smaller_area, 1)
+
+def extract_tile_detections(results, window, image_shape):
+    """
+    Parses the model results of one tile into full image coordinates. Each detection also
+    keeps its confidence and whether its box touches a tile border inside the image.
+    """
+    x1, y1, x2, y2 = window
+    height, width = image_shape[:2]
+    detections = []
+
+    for cls, confidence, keypoints, bbox in zip(results.boxes.cls.cpu().numpy(),
+                                                results.boxes.conf.cpu().numpy(),
+                                                results.keypoints.xy.cpu().numpy(),
+                                                results.boxes.xyxy.cpu().numpy()):
+        x_min, y_min, x_max, y_max = map(int, bbox)
+        truncated = ((x_min <= 1 and x1 > 0) or (y_min <= 1 and y1 > 0) or
+                     (x_max >= x2 - x1 - 2 and x2 < width) or (y_max >= y2 - y1 - 2 and y2 < height))
+
+        detections.append({
+            "label": results.names[int(cls)],
+            "bounding_box": [x_min + x1, y_min + y1, x_max + x1, y_max + y1],
+            "connection_points": [
+                [int(point[0]) + x1, int(point[1]) + y1] for point in keypoints if not (point[0] == 0 and point[1] == 0)
+            ],
+            "confidence": float(confidence),
+            "truncated": truncated
+        })
+
+    return detections
+
+def merge_tile_detections(detections, duplicate_threshold=0.7):
+    """
+    Keeps one detection per component seen in several overlapping tiles.
+    Complete boxes win over boxes cut by a tile border, then higher confidence wins.
+    """
+    kept = []
+    for detection in sorted(detections, key=lambda d: (d["truncated"], -d["confidence"])):
+        if any(other["label"] == detection["label"] and
+               overlap_ratio(other["bounding_box"], detection["bounding_box"]) >= duplicate_threshold
+               for other in kept):
+            continue
+        kept.append(detection)
+
+    return [{"label": d["label"], "bounding_box": d["bounding_box"], "connection_points": d["connection_points"]}
+            for d in kept]
+
+def detect_tiled(model, image, tile_size=1280, tile_overlap=256, batch_size=4, duplicate_threshold=0.7):
+    """
+    Runs the model on overlapping tile_size tiles instead of the downscaled full sheet, so a
+    tile is only downscaled by tile_size / 640. Components keep the scale of the 640 px training
+    images only when tile_size is close to 640. tile_overlap should be larger than the largest
+    component so every component is complete in at least one tile.
+    Returns the circuit_info of the whole image.
+    """
+    if tile_overlap >= tile_size:
+        # The tiles would not advance (or go backwards) and never cover the sheet
+        raise ValueError(f"tile_overlap ({tile_overlap}) must be smaller than tile_size ({tile_size}).")
+    height, width = image.shape[:2]
+    step = tile_size - tile_overlap
+    windows = [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+               for y in tile_starts(height, tile_size, step) for x in tile_starts(width, tile_size, step)]
+
+    detections = []
+    for batch_start in range(0, len(windows), batch_size):
+        batch_windows = windows[batch_start:batch_start + batch_size]
+        tiles = [to_model_input(image[y1:y2, x1:x2]) for x1, y1, x2, y2 in batch_windows]
+        for window, results in zip(batch_windows, model(tiles, batch=len(tiles), verbose=False)):
+            detections.extend(extract_tile_detections(results, window, image.shape))
+
+    return merge_tile_detections(detections, duplicate_threshold)
+
+class RegionUnion:
+    """
+    Union-find over region ids that are unique across all tiles. Each set keeps, at its root,
+    the top-left-most pixel over all its parts and whether a keypoint was snapped to it.
+    Only what a later tile or the final numbering can still use is kept, see prune.
+    """
+    def __init__(self):
+        self.next_region = 1  # 0 is the background
+        self.parent = {}  # Region -> parent region, roots are not stored
+        self.top_left = {}  # Root -> top-left-most pixel (y, x) of the set
+        self.hosting = set()  # Roots of the sets a keypoint was snapped to
+        self.transient = set()  # Regions of sets without a keypoint, dropped once no later tile reaches them
+
+    def add(self, count, local_top_left):
+        # Reserves count new ids for a tile's regions 1..count with their top-left pixels, returns the first id
+        first = self.next_region
+        self.next_region += count
+        for local_region, top_left in local_top_left.items():
+            self.top_left[local_region + first - 1] = top_left
+        self.transient.update(range(first, self.next_region))
+        return first
+
+    def find(self, region):
+        root = region
+        while root in self.parent:
+            root = self.parent[root]
+        while region != root:
+            self.parent[region], region = root, self.parent[region]
+        return root
+
+    def union(self, region_a, region_b):
+        root_a, root_b = self.find(region_a), self.find(region_b)
+        if root_a == root_b:
+            return
+        root, child = min(root_a, root_b), max(root_a, root_b)
+        self.parent[child] = root
+        child_top_left = self.top_left.pop(child)
+        if child_top_left < self.top_left[root]:
+            self.top_left[root] = child_top_left
+        if child in self.hosting:
+            self.hosting.remove(child)
+            self.hosting.add(root)
+
+    def mark_hosting(self, region):
+        self.hosting.add(self.find(region))
+
+    def prune(self, kept_regions):
+        """
+        Drops the sets without a keypoint that have no region in kept_regions (the regions of
+        the strips kept for later tiles), since no later tile can reach them, and the regions
+        of the other keypoint-free sets that are neither the root nor in kept_regions.
+        Sets with a keypoint are kept whole, the connection rows refer to their regions.
+        """
+        roots = {region: self.find(region) for region in self.transient}  # Also points every region at its root
+        live_roots = {self.find(region) for region in kept_regions}
+        for region, root in roots.items():
+            if root in self.hosting:
+                self.transient.discard(region)
+            elif root not in live_roots:
+                self.parent.pop(region, None)
+                self.top_left.pop(region, None)
+                self.transient.discard(region)
+            elif region != root and region not in kept_regions:
+                del self.parent[region]
+                self.transient.discard(region)
+
+def make_strip(window, labels):
+    # A strip of a tile kept for the later tiles that overlap it: its window, labels and their regions
+    return window, labels.copy(), set(np.unique(labels).tolist()) - {0}
+
+def stitch_overlap(region_union, strip, window, labels):
+    """
+    Merges the regions of two tiles that share foreground pixels where their windows overlap.
+    strip is (strip_window, strip_labels, strip_regions) kept from an earlier tile.
+    """
+    strip_window, strip_labels, _ = strip
+    x1, y1 = max(window[0], strip_window[0]), max(window[1], strip_window[1])
+    x2, y2 = min(window[2], strip_window[2]), min(window[3], strip_window[3])
+    if x1 >= x2 or y1 >= y2:
+        return
+
+    a = strip_labels[y1 - strip_window[1]:y2 - strip_window[1], x1 - strip_window[0]:x2 - strip_window[0]]
+    b = labels[y1 - window[1]:y2 - window[1], x1 - window[0]:x2 - window[0]]
+    shared = (a > 0) & (b > 0)
+    for region_a, region_b in np.unique(np.stack([a[shared], b[shared]], axis=1), axis=0).tolist():
+        region_union.union(region_a, region_b)
+
+def compute_netlist_tiled(image, circuit_info, tile_size=2048, max_snap_radius=TILED_SNAP_RADIUS, min_region_area=0):
+    """
+    Same as compute_netlist, but edge detection, masking and labeling run one tile at a time
+    so the edge and label buffers never exceed a tile plus its halo. Across tiles, only the
+    regions of the kept strips and of the sets keypoints were snapped to are remembered (see
+    RegionUnion.prune), so noise regions don't add up over the sheet.
+    Each tile is labeled together with a halo of max_snap_radius pixels: keypoints of the tile
+    are snapped inside it, and regions are stitched with the neighbouring tiles wherever the
+    halos overlap. Only the overlapping strips of already processed tiles are kept.
+    max_snap_radius must be set, keypoints further than that from any edge are left unconnected.
+    """
+    grayscale = to_grayscale(image)
+    height, width = grayscale.shape
+    halo = max(int(max_snap_radius), 1)
+
+    region_union = RegionUnion()
+    rows = []
+    previous_row_strips = {}  # Column -> bottom strip of that tile in the previous tile row
+
+    tile_keypoints = {}  # (tile row, tile column) -> keypoints lying in that tile
+    for component_index, component in enumerate(circuit_info):
+        for pin_index, (px, py) in enumerate(component["connection_points"]):
+            if py < height and px < width:
+                tile_keypoints.setdefault((py // tile_size, px // tile_size), []).append((component_index, pin_index,
+                                                                                          px, py))
+
+    for y0 in range(0, height, tile_size):
+        current_row_strips = {}
+        left_strip = None
+        for column, x0 in enumerate(range(0, width, tile_size)):
+            x1, y1 = min(x0 + tile_size, width), min(y0 + tile_size, height)
+            window = (max(x0 - halo, 0), max(y0 - halo, 0), min(x1 + halo, width), min(y1 + halo, height))
+
+            # Edges of the window plus a margin, cropped back to the window
+            margin = (max(window[0] - EDGE_MARGIN, 0), max(window[1] - EDGE_MARGIN, 0),
+                      min(window[2] + EDGE_MARGIN, width), min(window[3] + EDGE_MARGIN, height))
+            edges = detect_edges(grayscale[margin[1]:margin[3], margin[0]:margin[2]])
+            edges = edges[window[1] - margin[1]:window[3] - margin[1], window[0] - margin[0]:window[2] - margin[0]]
+
+            window_components = [{"bounding_box": [bx1 - window[0], by1 - window[1], bx2 - window[0], by2 - window[1]]}
+                                 for bx1, by1, bx2, by2 in (component["bounding_box"] for component in circuit_info)]
+            masked_edges = mask_components(edges, window_components, in_place=True)  # edges is a fresh array
+
+            region_count, labels, region_stats, _ = cv2.connectedComponentsWithStats(masked_edges, connectivity=4,
+                                                                                      ltype=cv2.CV_32S)
+            if min_region_area > 0:
+                # Only regions that do not reach the window border are known to be complete
+                left, top = region_stats[:, cv2.CC_STAT_LEFT], region_stats[:, cv2.CC_STAT_TOP]
+                right = left + region_stats[:, cv2.CC_STAT_WIDTH]
+                bottom = top + region_stats[:, cv2.CC_STAT_HEIGHT]
+                complete = (left > 0) & (top > 0) & (right < labels.shape[1]) & (bottom < labels.shape[0])
+                noise_regions = complete & (region_stats[:, cv2.CC_STAT_AREA] < min_region_area)
+                noise_regions[0] = False  # Background
+                if noise_regions.any():
+                    noise_mask = noise_regions[labels]
+                    masked_edges[noise_mask] = 0
+                    labels[noise_mask] = 0
+
+            local_top_left = {local_region: (y + window[1], x + window[0]) for local_region, (y, x)
+                              in find_region_top_left(labels, region_stats, range(1, region_count)).items()}
+
+            # Give the tile's regions ids that are unique across tiles
+            first_region = region_union.add(region_count - 1, local_top_left)
+            labels = np.where(labels > 0, labels + (first_region - 1), 0)
+
+            # Stitch with the earlier tiles whose windows overlap this one
+            for strip in [left_strip] + [previous_row_strips.get(column + offset) for offset in (-1, 0, 1)]:
+                if strip is not None:
+                    stitch_overlap(region_union, strip, window, labels)
+
+            # Snap the keypoints lying in this tile, the halo holds every edge within max_snap_radius
+            nearest_edge_index = NearestEdgeIndex(masked_edges, halo)
+            for component_index, pin_index, px, py in tile_keypoints.get((y0 // tile_size, column), []):
+                is_connected, connection_point = is_point_connected_or_nearest(nearest_edge_index, px - window[0],
+                                                                               py - window[1])
+                if is_connected:
+                    connected_px, connected_py = connection_point
+                    region = labels[connected_py, connected_px]
+                    if region > 0:
+                        region_union.mark_hosting(region)
+                        rows.append((component_index, pin_index, region, connected_px + window[0],
+                                     connected_py + window[1]))
+
+            # Keep only the parts of the window that later tiles overlap
+            strip_x, strip_y = max(x1 - halo, window[0]), max(y1 - halo, window[1])
+            left_strip = make_strip((strip_x, window[1], window[2], window[3]), labels[:, strip_x - window[0]:])
+            current_row_strips[column] = make_strip((window[0], strip_y, window[2], window[3]),
+                                                    labels[strip_y - window[1]:])
+
+            kept_strips = [left_strip, *current_row_strips.values(), *previous_row_strips.values()]
+            region_union.prune(set().union(*(strip_regions for _, _, strip_regions in kept_strips)))
+
+        previous_row_strips = current_row_strips
+
+    # Regions are the stitched roots, numbered by the top-left-most pixel over all their parts
+    connection_table = np.array([(component_index, pin_index, region_union.find(region), x, y)
+                                 for component_index, pin_index, region, x, y in rows], dtype=CONNECTION_TABLE_DTYPE)
+    region_top_left = {region: region_union.top_left[region] for region in set(connection_table["region"].tolist())}
+
+    return build_netlist(connection_table, region_top_left, circuit_info)